@@ -0,0 +1,92 @@
+import time
+import threading
+
+# A save starts once no change came in for AUTOSAVE_DELAY seconds, and at
+# the latest AUTOSAVE_MAX_DELAY seconds after the first unsaved change.
+AUTOSAVE_DELAY = 0.5
+AUTOSAVE_MAX_DELAY = 2.0
+
+class Autosave(threading.Thread):
+    """Background thread calling `save` for the changes announced through
+    `request`, coalescing those that come in while it waits or saves."""
+
+    def __init__(self, save, delay=AUTOSAVE_DELAY,
+            max_delay=AUTOSAVE_MAX_DELAY):
+        threading.Thread.__init__(self, name='autosave')
+        self.daemon = True
+        self.save = save
+        self.delay = delay
+        self.max_delay = max_delay
+
+        self.cond = threading.Condition()
+        self.first = self.last = None
+        self.urgent = False
+        self.saving = False
+        self.stopped = False
+        self.error = None
+        self.saves = 0
+
+    def request(self, urgent=False):
+        """Announce a change to be saved; return at once."""
+        with self.cond:
+            self.raise_error()
+            now = time.time()
+            if self.first is None:
+                self.first = now
+            self.last = now
+            self.urgent = self.urgent or urgent
+            self.cond.notify_all()
+
+    def flush(self):
+        """Save whatever changed and wait until it is on disk."""
+        with self.cond:
+            if self.first is None and not self.saving:
+                self.raise_error()
+                return
+            self.urgent = True
+            self.cond.notify_all()
+            while self.first is not None or self.saving:
+                self.cond.wait()
+            self.raise_error()
+
+    def stop(self):
+        self.request(urgent=True)
+        self.flush()
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        self.join()
+
+    def raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.first is None and not self.stopped:
+                    self.cond.wait()
+                if self.first is None:
+                    return
+
+                while not self.urgent and not self.stopped:
+                    remaining = min(self.last + self.delay,
+                            self.first + self.max_delay) - time.time()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+
+                self.first = self.last = None
+                self.urgent = False
+                self.saving = True
+
+            try:
+                self.save()
+            except Exception as e:
+                self.error = e
+
+            with self.cond:
+                self.saving = False
+                self.saves += 1
+                self.cond.notify_all()
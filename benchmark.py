@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+import grading
+
+SYLLABLES = ['an', 'bo', 'ca', 'de', 'el', 'fi', 'go', 'ha', 'ir', 'jo',
+        'ka', 'lu', 'mo', 'ni', 'or', 'pe', 'qu', 'ra', 'si', 'tu', 'vy', 'we']
+
+RUBRIC = [5, 10, 10, 15, 20]
+KEY_BACKSPACE = 263
+
+class ScriptEnd(Exception):
+    pass
+
+class FakeScreen:
+    """In-memory stand-in for a curses window that replays scripted keys
+    and times how long the grader takes to handle each of them."""
+
+    def __init__(self, keys, rows=24, columns=80):
+        self.keys = keys
+        self.rows = rows
+        self.columns = columns
+        self.y = self.x = 0
+        self.cells = 0
+
+        self.grading = None
+        self.latencies = {}
+        self.last_mode = None
+        self.last_time = None
+
+    def getch(self):
+        now = time.time()
+        if self.last_time is not None:
+            self.latencies.setdefault(self.last_mode, []).append(
+                    now - self.last_time)
+
+        if not self.keys:
+            raise ScriptEnd()
+
+        self.last_mode = self.grading.mode
+        raw_ch = self.keys.pop()
+        self.last_time = time.time()
+        return raw_ch
+
+    def getmaxyx(self):
+        return self.rows, self.columns
+
+    def getyx(self):
+        return self.y, self.x
+
+    def move(self, y, x):
+        self.y, self.x = y, x
+
+    def addstr(self, *args):
+        if len(args) > 2:
+            self.y, self.x = args[0], args[1]
+            text = args[2]
+        else:
+            text = args[0]
+        self.cells += len(text)
+        self.x += len(text)
+
+    def addch(self, *args):
+        if len(args) > 2:
+            self.y, self.x = args[0], args[1]
+        self.cells += 1
+        self.x += 1
+
+    def delch(self, y, x):
+        self.y, self.x = y, x
+        self.cells += 1
+
+    def clrtoeol(self):
+        self.cells += 1
+
+    def noop(self, *args):
+        pass
+
+    keypad = deleteln = refresh = noutrefresh = touchwin = erase = noop
+
+class FakeCurses:
+    """Just enough of the curses module for `Grading` to run headless."""
+
+    KEY_BACKSPACE = KEY_BACKSPACE
+    KEY_NPAGE, KEY_PPAGE = 338, 339
+    COLOR_RED = COLOR_WHITE = COLOR_YELLOW = COLOR_BLACK = COLOR_GREEN = 0
+    error = Exception
+
+    def __init__(self, screen):
+        self.screen = screen
+
+    def initscr(self):
+        return self.screen
+
+    def newpad(self, rows, columns):
+        return FakeScreen([], rows, columns)
+
+    def color_pair(self, n):
+        return 0
+
+    def noop(self, *args):
+        pass
+
+    start_color = init_pair = noecho = echo = cbreak = nocbreak = \
+            endwin = beep = doupdate = noop
+
+class Timed:
+    """Proxy recording the time spent in the methods of an object."""
+
+    def __init__(self, target, timings):
+        self.target = target
+        self.timings = timings
+
+    def __contains__(self, key):
+        return key in self.target
+
+    def __getattr__(self, name):
+        attr = getattr(self.target, name)
+        if not callable(attr):
+            return attr
+
+        def timed(*args, **kwargs):
+            start = time.time()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                self.timings.setdefault(name, []).append(time.time() - start)
+        return timed
+
+class BenchGrading(grading.Grading):
+    def __init__(self, subject, rubric, timings):
+        self.timings = timings
+        grading.Grading.__init__(self, subject, rubric=rubric)
+
+    def cache(self, flush=False):
+        start = time.time()
+        grading.Grading.cache(self, flush)
+        self.timings.setdefault('cache', []).append(time.time() - start)
+
+    def persist(self, flush=True):
+        # Runs on the autosave thread once the session has started.
+        start = time.time()
+        grading.Grading.persist(self, flush)
+        self.timings.setdefault('persist', []).append(time.time() - start)
+
+    def open_export(self):
+        start = time.time()
+        grading.Grading.open_export(self)
+        self.timings.setdefault('open_export', []).append(time.time() - start)
+        self.export = Timed(self.export, self.timings)
+
+def make_roster(filename, size, rng):
+    names = set()
+    fd = open(filename, 'w')
+    for idx in xrange(size):
+        while True:
+            name = ' '.join([''.join([rng.choice(SYLLABLES)
+                for x in range(rng.randint(2, 4))]).upper()
+                for y in range(2)])
+            if name not in names:
+                break
+        names.add(name)
+        fd.write('%d\t%s\t%s \tSTAT / LAS \t  \tSr \t3.0\n' % (
+            100000 + idx, 'ABCD'[idx % 4], name))
+    fd.close()
+    return sorted(names)
+
+def make_session(names, count, rng):
+    """Keystrokes selecting `count` students by name (with a typo corrected
+    now and then) and entering a score for every question."""
+    keys = []
+    for name in rng.sample(names, min(count, len(names))):
+        # Type the whole name so that the student is the first match.
+        typed = name
+        if rng.random() < 0.2:
+            keys.extend(map(ord, typed[:3] + 'x'))
+            keys.append(KEY_BACKSPACE)
+            typed = typed[3:]
+        keys.extend(map(ord, typed.lower()))
+        keys.append(ord('\n'))
+
+        for max in RUBRIC:
+            score = rng.randint(0, max)
+            keys.extend(map(ord, str(score) + ' '))
+        keys.append(ord('\n'))
+
+    keys.reverse()
+    return keys
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100.0))]
+
+def report(label, samples):
+    print '  %-12s n=%-7d p50 %8.1fus  p90 %8.1fus  p99 %8.1fus  max %8.1fus' \
+            % (label, len(samples), percentile(samples, 50) * 1e6,
+                percentile(samples, 90) * 1e6, percentile(samples, 99) * 1e6,
+                max(samples or [0]) * 1e6)
+
+def run(size, students, seed):
+    rng = random.Random(seed)
+    workdir = tempfile.mkdtemp(prefix='grading-bench-')
+    cwd = os.getcwd()
+    real_curses = grading.curses
+
+    try:
+        os.chdir(workdir)
+        names = make_roster('roster.txt', size, rng)
+        screen = FakeScreen(make_session(names, students, rng))
+        grading.curses = FakeCurses(screen)
+
+        timings = {}
+        start = time.time()
+        g = BenchGrading('bench', RUBRIC, timings)
+        startup = time.time() - start
+        screen.grading = g
+
+        try:
+            g.loop()
+        except ScriptEnd:
+            pass
+
+        start = time.time()
+        g.cache(flush=True)
+        g.save()
+        timings.setdefault('final_save', []).append(time.time() - start)
+    finally:
+        grading.curses = real_curses
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    print '[%d students] %d recorded, startup %.1fms, %d cells drawn' % (
+            size, len(g.records), startup * 1e3, screen.cells)
+    all_keys = sum(screen.latencies.values(), [])
+    report('keystroke', all_keys)
+    for mode, label in ((grading.MODE_NAME, 'NAME'),
+            (grading.MODE_GRADE, 'GRADE'),
+            (grading.MODE_COMMAND, 'COMMAND')):
+        if mode in screen.latencies:
+            report(label, screen.latencies[mode])
+    for name in sorted(timings):
+        report(name, timings[name])
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Replay scripted grading sessions against synthetic '
+                'rosters and report per-keystroke latency.')
+    parser.add_argument('--sizes', default='100,10000,100000',
+            help='comma separated roster sizes (default: %(default)s)')
+    parser.add_argument('--students', type=int, default=200,
+            help='students graded per session (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=330)
+    args = parser.parse_args()
+
+    for size in map(int, args.sizes.split(',')):
+        run(size, args.students, args.seed)
+
+if __name__ == "__main__":
+    main()
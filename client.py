@@ -0,0 +1,194 @@
+import sys
+import socket
+import select
+
+import curses
+
+from curves import parse_transform
+from grading import Grading, MODE_NAME, CURVE_COMMANDS
+from server import Connection
+from shards import make_shard
+from stats import SessionStats
+
+def connect(path):
+    """Connect to the grading server at `path`.  Returns the connection,
+    the session state it sends first and the messages that came after."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error as e:
+        raise ValueError('cannot connect to %s: %s' % (path, e.strerror))
+
+    connection = Connection(sock)
+    messages = []
+    while not messages:
+        messages = connection.receive()
+        if messages is None:
+            raise ValueError('%s closed the connection' % path)
+    return connection, messages[0], messages[1:]
+
+class RemoteGrading(Grading):
+    """Grading session served by a `GradeServer`.
+
+    The session state is a replica of the server's: grades and bonus or
+    penalty changes are sent to the server and applied here once it has
+    saved them, and the changes of the other graders are applied as they
+    come in.  Selecting a student first claims it on the server."""
+
+    def __init__(self, subject, connection, state, backlog=(),
+            instruments=None):
+        self.connection = connection
+        self.state = state
+        # Students claimed by the other graders.
+        self.claimed = set(state['claimed'])
+        self.backlog = list(backlog)
+        shard = state['shard'] and make_shard(*state['shard'])
+        Grading.__init__(self, subject, shard=shard, instruments=instruments,
+                roster=state['roster'], step=state['step'])
+
+    def load_cache(self):
+        state, self.state = self.state, None
+        if self.roster is None or len(self.namelist) != state['students']:
+            raise ValueError('the roster %s differs from the server\'s' % \
+                    state['roster'])
+
+        self.set_rubric(state['rubric'])
+        # Kept for prepare(), which loads the curve.
+        self.curve_specs = state['curve']
+        for record in state['records']:
+            self.records.put(record[0], record[1:])
+        for idx, bp in state['adjustments']:
+            self.records.set_adjustment(idx, bp)
+        self.remain_indices = set(state['remain'])
+        self.num_students = state['assigned']
+        self.name_index.reset(self.remain_indices - self.claimed)
+
+    def prepare(self):
+        # The export and the gradebook are the server's.
+        self.max_score = sum(self.rubric)
+        self.stats = SessionStats(self.rubric, self.records)
+        for spec in self.curve_specs:
+            self.curve.push(parse_transform(spec, self.rubric))
+        for message in self.backlog:
+            self.handle(message)
+        self.backlog = []
+
+    def persist(self, flush=True):
+        pass
+
+    def start_autosave(self):
+        pass
+
+    def save(self):
+        self.connection.close()
+
+    def commit_grade(self, idx, grades, flush=True):
+        self.request({'op': 'grade', 'idx': idx, 'grades': grades}, 'graded')
+        self.apply_grade(idx, grades)
+
+    def set_adjustment(self, idx, bp, flush=True):
+        self.request({'op': 'adjust', 'idx': idx, 'bp': bp}, 'adjusted')
+        self.records.set_adjustment(idx, bp)
+
+    def record_grade(self, grades):
+        try:
+            Grading.record_grade(self, grades)
+        except ValueError as e:
+            self.show_status('[SERVER] %s' % e)
+
+    def request(self, message, reply_op):
+        """Send `message` and wait for the server's `reply_op` about the
+        same student, handling the other messages meanwhile.  Returns the
+        reply, or raises ValueError with the server's error."""
+        self.connection.send(message)
+        while True:
+            received = self.receive()
+            for x in xrange(len(received)):
+                reply = received[x]
+                if reply['op'] == 'error' or (reply['op'] == reply_op and
+                        reply['idx'] == message['idx']):
+                    for other in received[x+1:]:
+                        self.handle(other)
+                    if reply['op'] == 'error':
+                        raise ValueError(reply['message'])
+                    return reply
+                self.handle(reply)
+
+    def claim(self, idx):
+        """Claim student `idx` on the server, raising ValueError if another
+        grader has it."""
+        reply = self.request({'op': 'claim', 'idx': idx}, 'claim')
+        if not reply['ok']:
+            raise ValueError(reply['message'])
+
+    def select_student(self, idx):
+        try:
+            self.claim(idx)
+        except ValueError as e:
+            self.show_status('[TAKEN] %s' % e)
+            return
+        Grading.select_student(self, idx)
+
+    def edit_grade(self, idx):
+        self.claim(idx)
+        Grading.edit_grade(self, idx)
+
+    def exec_command(self):
+        usr_cmd = ''.join(self.command[2:])
+        if usr_cmd == '!!' or usr_cmd.split(' ')[0] in CURVE_COMMANDS:
+            self.mode = self.command[0]
+            self.command = []
+            self.show_status('[SERVER] the session is kept by the server')
+            return
+        try:
+            Grading.exec_command(self)
+        except ValueError as e:
+            # A bonus/penalty refused by the server.
+            self.mode = self.command[0]
+            self.command = []
+            self.show_status('[SERVER] %s' % e)
+
+    def read_key(self):
+        while True:
+            readable = select.select([sys.stdin, self.connection], [], [])[0]
+            if self.connection in readable:
+                for message in self.receive():
+                    self.handle(message)
+                self.stdscr.refresh()
+            if sys.stdin in readable:
+                return self.stdscr.getch()
+
+    def receive(self):
+        messages = self.connection.receive()
+        if messages is None:
+            self.destroy_screen()
+            print '[SERVER] connection to the server lost'
+            sys.exit(1)
+        return messages
+
+    def handle(self, message):
+        """Apply a change pushed by the server."""
+        op, idx = message['op'], message.get('idx')
+        if op == 'claimed':
+            self.claimed.add(idx)
+            self.name_index.discard(idx)
+        elif op == 'released':
+            self.claimed.discard(idx)
+            if idx in self.remain_indices:
+                self.name_index.add(idx)
+        elif op == 'graded':
+            self.claimed.discard(idx)
+            self.apply_grade(idx, message['grades'])
+            if self.stats_shown:
+                self.show_stats()
+        elif op == 'adjusted':
+            self.records.set_adjustment(idx, message['bp'])
+        elif op == 'error':
+            self.show_status('[SERVER] %s' % message['message'])
+            return
+
+        if self.mode == MODE_NAME and len(self.buffer) > 2:
+            # Show the name list without the students just taken.
+            yx = self.stdscr.getyx()
+            self.search_name(self.buffer)
+            self.stdscr.move(*yx)
@@ -0,0 +1,231 @@
+from math import ceil
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from records import BP_FACTOR, BP_POINTS, adjustment_kind, apply_adjustment, \
+        parse_bonus_penalty
+
+def percentile(values, p):
+    """p-th percentile of `values`, rounded down to one of them."""
+    if numpy is not None:
+        return float(numpy.percentile(values, p, interpolation='lower'))
+    return sorted(values)[int((len(values) - 1) * p / 100.0)]
+
+class GiveBack:
+    """`giveback Q N`: N more points on question Q for everybody, up to the
+    question's maximum."""
+
+    def __init__(self, question, points):
+        self.question = question
+        self.points = points
+        self.spec = 'giveback %d %g' % (question + 1, points)
+
+    def apply_scores(self, columns, rubric):
+        column, top = columns[self.question], rubric[self.question]
+        if numpy is not None:
+            columns[self.question] = numpy.minimum(column + self.points, top)
+        else:
+            columns[self.question] = [min(score + self.points, top)
+                    for score in column]
+
+    def apply_grades(self, grades, rubric):
+        grades = list(grades)
+        grades[self.question] = min(grades[self.question] + self.points,
+                rubric[self.question])
+        return grades
+
+class SectionAdjustment:
+    """`section S BP`: the bonus/penalty BP (`+N`, `-N%`, ...) for every
+    student of section S."""
+
+    def __init__(self, section, bp, text):
+        self.section = section
+        self.kind, self.value = adjustment_kind(bp)
+        self.spec = 'section %s %s' % (section, text)
+
+    def apply(self, totals, sections, max_score):
+        if numpy is not None:
+            return numpy.where(sections == self.section,
+                    apply_adjustment(totals, self.kind, self.value), totals)
+        return [apply_adjustment(totals[x], self.kind, self.value)
+                if sections[x] == self.section else totals[x]
+                for x in xrange(len(totals))]
+
+    def apply_one(self, total, section, max_score):
+        if section != self.section:
+            return total
+        return apply_adjustment(total, self.kind, self.value)
+
+class LinearCurve:
+    """`curve linear A [B]`: every total becomes A * total + B."""
+
+    def __init__(self, a, b=0.0):
+        self.a = a
+        self.b = b
+        self.spec = 'curve linear %g %g' % (a, b)
+
+    def apply(self, totals, sections, max_score):
+        if numpy is not None:
+            return totals * self.a + self.b
+        return [total * self.a + self.b for total in totals]
+
+    def apply_one(self, total, section, max_score):
+        return total * self.a + self.b
+
+class PercentileCurve:
+    """`curve pct P`: scale the totals so that the P-th percentile reaches
+    the maximum score."""
+
+    # Every total depends on the whole class.
+    relative = True
+
+    def __init__(self, p):
+        self.p = p
+        self.spec = 'curve pct %g' % p
+        # Percentile of the class totals, as of the last `Curve.totals`.
+        self.reference = None
+
+    def apply(self, totals, sections, max_score):
+        if not len(totals):
+            return totals
+        self.reference = percentile(totals, self.p)
+        factor = self.factor(max_score)
+        if numpy is not None:
+            return totals * factor
+        return [total * factor for total in totals]
+
+    def apply_one(self, total, section, max_score):
+        return total * self.factor(max_score)
+
+    def factor(self, max_score):
+        if self.reference is None or self.reference <= 0:
+            return 1.0
+        return max_score / self.reference
+
+class Curve:
+    """Bulk adjustments of a session: give-backs, per-section bonuses and
+    curves, kept as a stack of transforms.
+
+    Nothing recorded is changed; the transforms are applied in the order
+    they were added, on top of the per-student bonus/penalty, whenever
+    totals are needed.  Give-backs act on the question scores before they
+    are summed.  Every transform is one operation over all the rows, and
+    popping one undoes it."""
+
+    def __init__(self, rubric, section_of):
+        self.rubric = rubric
+        self.max_score = float(sum(rubric))
+        self.section_of = section_of
+        self.sections = {}
+        self.transforms = []
+
+    def __len__(self):
+        return len(self.transforms)
+
+    def specs(self):
+        return [transform.spec for transform in self.transforms]
+
+    def push(self, transform):
+        self.transforms.append(transform)
+
+    def pop(self):
+        return self.transforms.pop()
+
+    def relative(self):
+        """Whether a grade can change the totals of the other students."""
+        return any(getattr(transform, 'relative', False)
+                for transform in self.transforms)
+
+    def section(self, idx):
+        section = self.sections.get(idx)
+        if section is None:
+            section = self.sections[idx] = self.section_of(idx)
+        return section
+
+    def totals(self, records):
+        """Return the real total of every row of `records`."""
+        width = records.width
+        students = records.students
+        if numpy is not None:
+            matrix = numpy.array(records.matrix())
+            columns = [matrix[:, x] for x in xrange(width)]
+        else:
+            columns = [list(records.scores[x::width]) for x in xrange(width)]
+
+        for transform in self.transforms:
+            if isinstance(transform, GiveBack):
+                transform.apply_scores(columns, self.rubric)
+
+        if numpy is not None:
+            rows = numpy.array(students, dtype=int)
+            kinds = numpy.frombuffer(records.bp_kind, dtype=numpy.int8)[rows]
+            values = numpy.frombuffer(records.bp_value, dtype=float)[rows]
+            totals = sum(columns) if columns else numpy.zeros(len(students))
+            totals = numpy.where(kinds == BP_FACTOR, totals * values,
+                    numpy.where(kinds == BP_POINTS, totals + values, totals))
+        else:
+            totals = [apply_adjustment(sum(column[x] for column in columns),
+                records.bp_kind[students[x]], records.bp_value[students[x]])
+                for x in xrange(len(students))]
+
+        sections = None
+        for transform in self.transforms:
+            if isinstance(transform, GiveBack):
+                continue
+            if sections is None and isinstance(transform, SectionAdjustment):
+                sections = [self.section(idx) for idx in students]
+                if numpy is not None:
+                    sections = numpy.array(sections, dtype=object)
+            totals = transform.apply(totals, sections, self.max_score)
+
+        if numpy is not None:
+            return numpy.clip(numpy.ceil(totals), 0, self.max_score).tolist()
+        return [max(0.0, min(ceil(total), self.max_score)) for total in totals]
+
+    def total(self, records, idx, grades):
+        """Real total of student `idx` with `grades`.  Only the row itself
+        is computed; percentile curves use the class reference of the last
+        `totals`, which the export rewrite keeps up to date."""
+        if any(getattr(transform, 'relative', False) and
+                transform.reference is None for transform in self.transforms):
+            self.totals(records)
+
+        for transform in self.transforms:
+            if isinstance(transform, GiveBack):
+                grades = transform.apply_grades(grades, self.rubric)
+        total = apply_adjustment(sum(grades), records.bp_kind[idx],
+                records.bp_value[idx])
+
+        section = None
+        for transform in self.transforms:
+            if isinstance(transform, GiveBack):
+                continue
+            if section is None and isinstance(transform, SectionAdjustment):
+                section = self.section(idx)
+            total = transform.apply_one(total, section, self.max_score)
+        return max(0.0, min(ceil(total), self.max_score))
+
+def parse_transform(text, rubric):
+    """Parse a bulk adjustment: `curve linear A [B]`, `curve pct P`,
+    `section S BP` or `giveback Q N`."""
+    words = text.split()
+    try:
+        if words[:2] == ['curve', 'linear'] and len(words) in (3, 4):
+            return LinearCurve(float(words[2]),
+                    float(words[3]) if len(words) == 4 else 0.0)
+        if words[:2] == ['curve', 'pct'] and len(words) == 3 and \
+                0 < float(words[2]) <= 100:
+            return PercentileCurve(float(words[2]))
+        if words[0] == 'section' and len(words) == 3 and \
+                parse_bonus_penalty(words[2]) is not None:
+            return SectionAdjustment(words[1],
+                    parse_bonus_penalty(words[2]), words[2])
+        if words[0] == 'giveback' and len(words) == 3 and \
+                0 < int(words[1]) <= len(rubric) and float(words[2]) > 0:
+            return GiveBack(int(words[1]) - 1, float(words[2]))
+    except (IndexError, ValueError):
+        pass
+    raise ValueError('invalid adjustment %s' % text)
@@ -0,0 +1,97 @@
+import csv
+
+class _LineSink:
+    def write(self, data):
+        self.data = data
+
+class CsvExport:
+    """CSV file kept current row by row while grading.
+
+    Rows are appended as they are recorded and addressed by a key afterwards.
+    Updating a row rewrites it in place when its length is unchanged and
+    otherwise only the part of the file that follows it."""
+
+    def __init__(self, filename, header):
+        self.filename = filename
+        self.header = header
+        self.fd = None
+
+        self.sink = _LineSink()
+        self.writer = csv.writer(self.sink, lineterminator='\n')
+
+        self.rows = {}
+        self.starts = []
+        self.end = 0
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def __len__(self):
+        return len(self.starts)
+
+    def render(self, row):
+        self.writer.writerow(row)
+        return self.sink.data
+
+    def rewrite(self, keyed_rows=()):
+        """Start the file over from the header and `(key, row)` pairs."""
+        if self.fd is not None:
+            self.fd.close()
+        self.fd = open(self.filename, 'w+b')
+
+        self.rows = {}
+        self.starts = []
+        self.end = 0
+
+        line = self.render(self.header)
+        self.fd.write(line)
+        self.end = len(line)
+
+        for key, row in keyed_rows:
+            self.append(key, row, flush=False)
+        self.fd.flush()
+
+    def append(self, key, row, flush=True):
+        line = self.render(row)
+        self.rows[key] = len(self.starts)
+        self.starts.append(self.end)
+        self.fd.write(line)
+        self.end += len(line)
+
+        if flush:
+            self.fd.flush()
+
+    def update(self, key, row):
+        pos = self.rows[key]
+        start = self.starts[pos]
+        stop = self.starts[pos+1] if pos + 1 < len(self.starts) else self.end
+
+        line = self.render(row)
+        delta = len(line) - (stop - start)
+
+        tail = ''
+        if delta:
+            self.fd.seek(stop)
+            tail = self.fd.read()
+
+        self.fd.seek(start)
+        self.fd.write(line + tail)
+        if delta < 0:
+            self.fd.truncate()
+
+        if delta:
+            for x in xrange(pos+1, len(self.starts)):
+                self.starts[x] += delta
+            self.end += delta
+
+        self.fd.seek(self.end)
+        self.fd.flush()
+
+    def flush(self):
+        if self.fd is not None:
+            self.fd.flush()
+
+    def close(self):
+        if self.fd is not None:
+            self.fd.close()
+            self.fd = None
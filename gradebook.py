@@ -0,0 +1,194 @@
+import sqlite3
+
+from curves import Curve, parse_transform
+from records import RecordStore, adjusted_score, adjustment_kind, BP_NONE, \
+        BP_POINTS, BP_FACTOR
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS students (
+    id TEXT PRIMARY KEY,
+    section TEXT,
+    name TEXT NOT NULL,
+    fields TEXT
+);
+CREATE TABLE IF NOT EXISTS assignments (
+    name TEXT PRIMARY KEY,
+    rubric TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scores (
+    assignment TEXT NOT NULL,
+    student TEXT NOT NULL,
+    question INTEGER NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (assignment, student, question)
+);
+CREATE INDEX IF NOT EXISTS scores_by_student ON scores (student, assignment);
+CREATE TABLE IF NOT EXISTS adjustments (
+    assignment TEXT NOT NULL,
+    student TEXT NOT NULL,
+    kind INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (assignment, student)
+);
+CREATE TABLE IF NOT EXISTS curves (
+    assignment TEXT PRIMARY KEY,
+    specs TEXT NOT NULL
+);
+'''
+
+class Gradebook:
+    """SQLite gradebook of students, assignments, per-question scores,
+    bonus/penalty adjustments and the bulk adjustments (curves) of each
+    assignment, keyed by student id and assignment name.
+
+    Writes are collected in the current transaction until `commit`."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        # Commits may come from the autosave thread of grading.py, which
+        # serializes them with everything else that touches the gradebook.
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.text_factory = str
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def commit(self):
+        self.db.commit()
+
+    def sync_roster(self, roster):
+        """Insert or update the students of a roster (lists of roster
+        columns: id, section, name, ...)."""
+        self.db.executemany(
+            'INSERT OR REPLACE INTO students (id, section, name, fields) '
+            'VALUES (?, ?, ?, ?)',
+            ((r[0].strip(), r[1].strip(), r[2].strip(),
+                '\t'.join(x.strip() for x in r[3:])) for r in roster))
+        self.db.commit()
+
+    def students(self):
+        """Yield `(id, section, name)` ordered by id."""
+        return self.db.execute(
+            'SELECT id, section, name FROM students ORDER BY id')
+
+    def add_assignment(self, name, rubric):
+        current = self.rubric(name)
+        if current is not None and current != list(rubric):
+            raise ValueError('%s is already graded on rubric %s' % (
+                name, ' '.join(map(str, current))))
+
+        self.db.execute(
+            'INSERT OR IGNORE INTO assignments (name, rubric) VALUES (?, ?)',
+            (name, ' '.join(map(str, rubric))))
+        self.db.commit()
+
+    def assignments(self):
+        return [row[0] for row in self.db.execute(
+            'SELECT name FROM assignments ORDER BY name')]
+
+    def rubric(self, name):
+        row = self.db.execute('SELECT rubric FROM assignments WHERE name = ?',
+                (name,)).fetchone()
+        return map(int, row[0].split()) if row else None
+
+    def record(self, assignment, student, grades):
+        self.db.executemany(
+            'INSERT OR REPLACE INTO scores (assignment, student, question, '
+            'score) VALUES (?, ?, ?, ?)',
+            [(assignment, student, x + 1, grades[x])
+                for x in xrange(len(grades))])
+
+    def record_many(self, assignment, entries):
+        """Record `(student, grades)` pairs in one statement."""
+        self.db.executemany(
+            'INSERT OR REPLACE INTO scores (assignment, student, question, '
+            'score) VALUES (?, ?, ?, ?)',
+            ((assignment, student, x + 1, grades[x])
+                for student, grades in entries
+                for x in xrange(len(grades))))
+
+    def adjust(self, assignment, student, bp):
+        kind, value = adjustment_kind(bp)
+        if kind == BP_NONE:
+            self.db.execute('DELETE FROM adjustments WHERE assignment = ? '
+                    'AND student = ?', (assignment, student))
+        else:
+            self.db.execute(
+                'INSERT OR REPLACE INTO adjustments (assignment, student, '
+                'kind, value) VALUES (?, ?, ?, ?)',
+                (assignment, student, kind, value))
+
+    def set_curve(self, assignment, specs):
+        """Keep the bulk adjustments of `assignment`, as the `Curve.specs`
+        of grading.py."""
+        if specs:
+            self.db.execute('INSERT OR REPLACE INTO curves (assignment, '
+                    'specs) VALUES (?, ?)', (assignment, '\n'.join(specs)))
+        else:
+            self.db.execute('DELETE FROM curves WHERE assignment = ?',
+                    (assignment,))
+
+    def curve(self, assignment):
+        row = self.db.execute('SELECT specs FROM curves WHERE assignment = ?',
+                (assignment,)).fetchone()
+        return row[0].split('\n') if row else []
+
+    def submitted(self, assignment):
+        """Return the ids of the students with scores for `assignment`."""
+        return set(row[0] for row in self.db.execute(
+            'SELECT DISTINCT student FROM scores WHERE assignment = ?',
+            (assignment,)))
+
+    def report(self, assignment):
+        """Return the header and the rows of `assignment` laid out like the
+        CSV export of grading.py: id, section, name, q1..qn, bop, total.
+        The totals are curved as in the export."""
+        rubric = self.rubric(assignment)
+        if rubric is None:
+            raise KeyError(assignment)
+
+        adjustments = dict(((row[0]), (row[1], row[2])) for row in
+            self.db.execute('SELECT student, kind, value FROM adjustments '
+                'WHERE assignment = ?', (assignment,)))
+
+        header = ['id', 'section', 'name'] + \
+                ['q%d' % x for x in range(1, len(rubric)+1)] + ['bop', 'total']
+        rows = []
+        current = None
+        for sid, section, name, question, score in self.db.execute(
+                'SELECT s.id, s.section, s.name, sc.question, sc.score '
+                'FROM scores sc JOIN students s ON s.id = sc.student '
+                'WHERE sc.assignment = ? ORDER BY s.id, sc.question',
+                (assignment,)):
+            if current is None or current[0] != sid:
+                current = [sid, section, name] + [0.0] * len(rubric)
+                rows.append(current)
+            current[2 + question] = score
+
+        specs = self.curve(assignment)
+        if specs:
+            # Students are numbered by row, as their roster index would be.
+            curve = Curve(rubric, lambda idx: rows[idx][1])
+            for spec in specs:
+                curve.push(parse_transform(spec, rubric))
+            records = RecordStore(len(rubric), len(rows))
+            for x in xrange(len(rows)):
+                records.put(x, rows[x][3:])
+                kind, value = adjustments.get(rows[x][0], (BP_NONE, 0.0))
+                records.bp_kind[x], records.bp_value[x] = kind, value
+            totals = curve.totals(records)
+
+        for x in xrange(len(rows)):
+            row = rows[x]
+            kind, value = adjustments.get(row[0], (BP_NONE, 0.0))
+            bop = {BP_POINTS: int(value), BP_FACTOR: value}.get(kind, 0)
+            if specs:
+                total = totals[x]
+            else:
+                total = adjusted_score(sum(row[3:]), kind, value, sum(rubric))
+            row.extend([bop, total])
+
+        return header, rows
@@ -2,50 +2,165 @@
 
 import sys
 import os
-import re
+import csv
+import time
+import threading
+import argparse
 import curses
 import readline
-import cPickle as pickle
-from math import ceil
+
+from autosave import Autosave
+from curves import Curve, parse_transform
+from export import CsvExport
+from gradebook import Gradebook
+from instrument import Instruments, PROFILE_ENV
+from journal import Journal, ENTRY_GRADE, ENTRY_POINTS, ENTRY_FACTOR
+from records import RecordStore, REGEX_BNP, parse_bonus_penalty
+from rosterindex import RosterIndex
+from render import Surface
+from server import GradeServer, socket_name
+from scoreentry import ScoreAutomaton, DEFAULT_STEP, START, ACCEPT
+from shards import IndexShard, SectionShard
+from stats import SessionStats, plot_summary
 
 MODE_RUBRIC, MODE_NAME, MODE_GRADE, MODE_COMMAND = 1,2,3, 4
+MODE_LABELS = {MODE_RUBRIC: 'RUBRIC', MODE_NAME: 'NAME', MODE_GRADE: 'GRADE',
+        MODE_COMMAND: 'COMMAND'}
 COLOR_PAIR_PROMPT, COLOR_PAIR_NAME, COLOR_PAIR_CMD = 1,2,3
 ROW_NAME, ROW_RUBRIC, ROW_GRADE, ROW_LIST = 0,1,2,3
 
 BONUS_PENALTY_CMDS = (ord('+'), ord('-'))
 
-REGEX_BNP = re.compile(r'^([+|-])(\d+)(\%?)$')
+INGEST_BATCH = 1000
+
+# Commands changing the bulk adjustments of the session.
+CURVE_COMMANDS = ('curve', 'section', 'giveback', 'undo')
+
+# Handlers timed by --profile.
+HOT_PATHS = ['name_keypress', 'grade_keypress', 'search_name', 'show_matches',
+        'show_stats', 'show_grade', 'show_status', 'lookup_id',
+        'type_score_key', 'finish_score', 'exec_command', 'record_grade',
+        'commit_grade', 'set_adjustment', 'cache', 'parse_entry']
+
+STATS_LABELS = ['MEAN: ', 'SD: ', 'MIN: ', 'MAX: ', 'HIST: ']
+
+# Matches shown per page; digits select within the page.
+MATCH_PAGE = 9
+PAGE_KEYS = {'\t': 1}
+
+def parse_rubric(raw_rubric):
+    if raw_rubric and all(map(lambda x: x.isdigit(),
+            raw_rubric.split(' '))):
+        return map(int, raw_rubric.split(' '))
+    return None
+
+def session_name(subject, shard):
+    return subject if shard is None else '%s-%s' % (subject, shard.tag)
 
 class Grading:
-    def __init__(self, subject):
+    def __init__(self, subject, rubric=None, interactive=True, shard=None,
+            gradebook=None, instruments=None, roster='roster.txt',
+            step=DEFAULT_STEP):
         self.subject = subject
+        self.step = step
+        self.instruments = instruments
+        if instruments is not None:
+            instruments.wrap(self, HOT_PATHS)
+        # Every shard of a subject keeps its own cache and export.
+        self.shard = shard
+        self.name = session_name(subject, shard)
         self.records = []
         self.buffer = [] 
+        # Automaton states of the score being typed in GRADE mode, and the
+        # scores already typed.
+        self.entry_states = []
+        self.entered = []
         self.command = []
         self.rubric = []
         self.name_offset = len('NAME: ') - 1
         self.mode = MODE_RUBRIC
         self.selected_index = -1
-        self.bonus_penalty = []
+        self.stats_shown = False
 
         self.matched_indices = []
-        self.load_roster()
+        self.match_page = 0
+        self.page_size = MATCH_PAGE
+        self.journal = Journal(self.name)
+        self.gradebook = gradebook
+        # Guards the session state against the autosave thread.
+        self.lock = threading.RLock()
+        self.autosave = None
+        # Set when a grade changed totals curved against the whole class;
+        # the export is rewritten on the next persist.
+        self.export_stale = False
+        # (step, seconds) spent getting the session ready.
+        self.startup = []
+        started = time.time()
+        self.load_roster(roster)
+        self.startup.append((['roster', 'roster(rebuilt)'][
+            bool(self.roster and self.roster_rebuilt)], time.time() - started))
+        started = time.time()
         self.load_cache()
-        self.start()
+        self.startup.append(('cache', time.time() - started))
+        if rubric and not self.rubric:
+            self.set_rubric(rubric)
+            self.cache(flush=True)
+        if interactive:
+            self.start()
 
     def start(self):
         if not self.rubric:
             self.get_rubric()
+            self.cache(flush=True)
         self.init_screen()
         self.show_rubric()
-        self.max_score = sum(self.rubric)
+        started = time.time()
+        try:
+            self.prepare()
+        except ValueError:
+            self.destroy_screen()
+            raise
+        self.startup.append(('export', time.time() - started))
+        self.start_autosave()
         if self.records:
             self.show_status(
-                '[CACHE] %d entries recovered from local cache. (!! to swipe)' % \
-                        len(self.records))
+                '[CACHE] %d entries recovered from local cache. (!! to swipe) '
+                '[STARTUP] %s' % (len(self.records), self.startup_report()))
+        else:
+            self.show_status('[STARTUP] %s' % self.startup_report())
                 
         self.stdscr.addstr(ROW_NAME, 0, "NAME: ", curses.color_pair(1))
 
+    def prepare(self):
+        self.max_score = sum(self.rubric)
+        self.stats = SessionStats(self.rubric, self.records)
+        for spec in self.journal.load_curve():
+            self.curve.push(parse_transform(spec, self.rubric))
+        self.open_export()
+        if self.gradebook is not None:
+            self.open_gradebook()
+
+    def open_gradebook(self):
+        """Register the roster and the subject in the gradebook and bring
+        it up to date with the grades recovered from the cache."""
+        if None in self.id_index.itervalues():
+            raise ValueError('the gradebook needs unique student ids')
+
+        self.gradebook.sync_roster(self.roster)
+        self.gradebook.add_assignment(self.subject, self.rubric)
+        self.gradebook.set_curve(self.subject, self.curve.specs())
+        self.gradebook.record_many(self.subject,
+                ((self.student_id(record[0]), record[1:])
+                    for record in self.records))
+        for idx in self.records.students:
+            self.gradebook.adjust(self.subject, self.student_id(idx),
+                    self.records.adjustment(idx))
+        self.gradebook.commit()
+
+    def startup_report(self):
+        return ' '.join('%s %.0fms' % (step, seconds * 1000)
+                for step, seconds in self.startup)
+
     def init_screen(self):
         self.stdscr = curses.initscr()
         curses.start_color()
@@ -62,6 +177,14 @@ class Grading:
         self.ROW_MAX, self.COLUMN_MAX = map(lambda x: x-1,
                 list(self.stdscr.getmaxyx()))
 
+        self.surface = Surface(self.stdscr, self.COLUMN_MAX)
+        # The match list lives in a pad so that it can be paged without
+        # ever writing past the bottom of the screen.
+        self.list_pad = curses.newpad(max(1, self.ROW_MAX - ROW_LIST),
+                self.COLUMN_MAX + 1)
+        self.list_surface = Surface(self.list_pad, self.COLUMN_MAX)
+        self.list_height = 0
+
     def destroy_screen(self):
         curses.nocbreak()
         self.stdscr.keypad(0)
@@ -70,82 +193,164 @@ class Grading:
 
     def get_rubric(self):
         while True:
-            raw_rubric = raw_input('RUBRIC: ')
-            if all(map(lambda x: x.isdigit(),
-                    raw_rubric.split(' '))):
-                self.rubric = map(int, raw_rubric.split(' '))
-                self.num_questions = len(self.rubric)
-                self.grade_spaces = map(
-                        lambda x: len(str(x)) + 3,
-                        self.rubric)
-                self.mode = MODE_NAME
+            rubric = parse_rubric(raw_input('RUBRIC: '))
+            if rubric:
+                self.set_rubric(rubric)
                 break
 
+    def set_rubric(self, rubric):
+        self.rubric = rubric
+        self.num_questions = len(self.rubric)
+        self.grade_spaces = map(
+                lambda x: len(str(x)) + 3,
+                self.rubric)
+        self.automata = [ScoreAutomaton(max, self.step)
+                for max in self.rubric]
+        self.curve = Curve(self.rubric, self.section_of)
+        self.records = RecordStore(self.num_questions, len(self.namelist))
+        self.mode = MODE_NAME
+
     def grade_keypress(self, raw_ch):
         if raw_ch == curses.KEY_BACKSPACE:
-            if self.buffer:
-                ch = self.buffer.pop()
-                if ch == ' ' and self.buffer:
-                    while True:
-                        self.buffer.pop()
-                        if not self.buffer or self.buffer[-1] == ' ':
-                            break
+            self.erase_score_key()
 
-        if raw_ch < 256:
+        elif raw_ch < 256:
             ch = chr(raw_ch)
-            if ch.isdigit():
-                self.buffer.append(ch)
-            elif ch == '.':
-                if not self.buffer or \
-                        self.buffer[-1] != '.':
-                    self.buffer.append(ch)
-            elif ch == ' ':
-                if self.buffer and self.buffer[-1].isdigit():
-                    self.buffer.append(' ')
+            if ch == ' ':
+                self.finish_score()
             elif ch == '\n':
-                grades = map(float, 
-                        ''.join(self.buffer).strip().split(' '))
-                if len(grades) == len(self.rubric):
-                    total_grade = self.real_score(self.selected_index, 
-                            sum(grades))
+                if self.finish_score() and \
+                        len(self.entered) == len(self.rubric):
+                    grades = list(self.entered)
+                    total_grade = self.real_total(self.selected_index,
+                            grades)
                     max_grade = sum(self.rubric)
 
-                    self.show_grade(color=COLOR_PAIR_PROMPT)
-                    self.stdscr.addstr("TOTAL: %d/%d" % \
-                            (total_grade, max_grade), 
-                            curses.color_pair(COLOR_PAIR_PROMPT)
-                            )
+                    self.show_grade(color=COLOR_PAIR_PROMPT,
+                            suffix="TOTAL: %d/%d" % (total_grade, max_grade))
                     
                     self.record_grade(grades)
                     self.cache()
                     self.set_mode(MODE_NAME)
                     return
+            else:
+                self.type_score_key(ch)
 
-        self.parse_grade()
         self.show_grade()
 
-    def show_status(self, status, color=COLOR_PAIR_NAME):
-        yx = self.stdscr.getyx()
+    def type_score_key(self, ch):
+        """Feed `ch` to the automaton of the current question, beeping if no
+        score starts the way it is being typed."""
+        if len(self.entered) == len(self.rubric):
+            return
 
-        self.clear_lines(self.ROW_MAX, 1)
-        self.stdscr.addstr(self.ROW_MAX, 0, status,
-            curses.color_pair(color))
+        state = self.entry_states[-1] if self.entry_states else START
+        automaton = self.automata[len(self.entered)]
+        state = automaton.next(state, ch)
+        if state is None:
+            if ch.isdigit() or ch == '.':
+                curses.beep()
+            return
 
+        self.buffer.append(ch)
+        self.entry_states.append(state)
+        if automaton.kinds[state] == ACCEPT:
+            # Nothing longer is a score of the question; move on.
+            self.finish_score()
+
+    def finish_score(self):
+        """Close the score being typed, written back as its value.  Returns
+        False if what is typed is not a whole score."""
+        if not self.entry_states:
+            return True
+
+        score = self.automata[len(self.entered)].values[self.entry_states[-1]]
+        if score is None:
+            return False
+
+        del self.buffer[len(self.buffer) - len(self.entry_states):]
+        self.buffer.extend('%g ' % score)
+        self.entry_states = []
+        self.entered.append(score)
+        return True
+
+    def erase_score_key(self):
+        if self.entry_states:
+            self.buffer.pop()
+            self.entry_states.pop()
+        elif self.buffer:
+            # Erasing the space after a score erases the whole score.
+            self.buffer.pop()
+            while self.buffer and self.buffer[-1] != ' ':
+                self.buffer.pop()
+            self.entered.pop()
+
+    def show_status(self, status, color=COLOR_PAIR_NAME):
+        yx = self.stdscr.getyx()
+        self.surface.draw(self.ROW_MAX, status, curses.color_pair(color))
         self.stdscr.move(*yx)
 
+    def commit_grade(self, idx, grades, flush=True):
+        """Record the grades of student `idx`, replacing the ones recorded
+        before if any."""
+        with self.lock:
+            old = self.apply_grade(idx, grades)
+            self.journal.append_grade(idx, grades)
+            if self.gradebook is not None:
+                self.gradebook.record(self.subject, self.student_id(idx),
+                        grades)
+
+            if self.curve.relative():
+                self.export_stale = True
+            elif old is not None:
+                self.export.update(idx, self.export_row(idx))
+            else:
+                self.export.append(idx, self.export_row(idx), flush=flush)
+
+    def apply_grade(self, idx, grades):
+        """Put the grades of student `idx` into the session state.  Returns
+        the grades they replace, if any."""
+        old = self.records.put(idx, grades)
+        if old is not None:
+            self.stats.remove(old)
+        self.stats.add(grades)
+
+        if old is None:
+            # Remove current index from the remaining search list to
+            # gurantee that we only record grades for every student once.
+            self.remain_indices.remove(idx)
+            self.name_index.discard(idx)
+        return old
+
+    def set_adjustment(self, idx, bp, flush=True):
+        with self.lock:
+            self.records.set_adjustment(idx, bp)
+            self.journal.append_adjustment(idx, bp)
+            if self.gradebook is not None:
+                self.gradebook.adjust(self.subject, self.student_id(idx), bp)
+            if flush:
+                self.cache()
+
+            if self.curve.relative():
+                self.export_stale = True
+            elif idx in self.export:
+                self.export.update(idx, self.export_row(idx))
+
     def record_grade(self, grades):
         if self.selected_index != -1 and \
                 self.selected_index < len(self.namelist):
-            self.records.append([self.selected_index] + grades)
-            # Remove current index from the remaining search list to gurantee
-            # that we only record grades for every student once.
-            self.remain_indices.remove(self.selected_index)
-
-            self.show_status("[RECORDED] %s: %d/%d // [%d/%d]" % (
+            amended = self.selected_index in self.records
+            self.commit_grade(self.selected_index, grades,
+                    flush=self.autosave is None)
+            if self.stats_shown:
+                self.show_stats()
+
+            self.show_status("[%s] %s: %d/%d // [%d/%d]" % (
+                ['RECORDED', 'AMENDED'][amended],
                 self.namelist[self.selected_index],
-                self.real_score(self.selected_index, sum(grades)), 
+                self.real_total(self.selected_index, grades),
                 sum(self.rubric),
-                len(self.records), len(self.namelist)))
+                len(self.records), self.num_students))
 
     def name_keypress(self, raw_ch):
         """Handle keypress events under the NAME mode where the user is
@@ -157,14 +362,17 @@ class Grading:
 
         if raw_ch < 256:
             ch = chr(raw_ch)
+            # A digit typed with no name in the list starts a student id
+            # rather than picking from the list.
+            id_key = ch.isdigit() and (self.buffer[0].isdigit()
+                    if self.buffer else not self.matched_indices)
 
-            if ch.isalpha() or ch in ["'", ' ']:
+            if ch.isalpha() or ch in ["'", ' '] or id_key:
                 self.buffer.append(ch)
                 self.stdscr.addch(raw_ch)
 
             elif (ch == '\n' and self.matched_indices) or \
-                    (ch.isdigit() and self.matched_indices and \
-                    int(ch) <= len(self.matched_indices)):
+                    (ch.isdigit() and 0 < int(ch) <= len(self.current_page())):
 
                 # If user presses enter or specify a number,
                 # select the student and proceed to SCORE mode.
@@ -174,31 +382,78 @@ class Grading:
                 else:
                     idx = int(ch) - 1
 
-                self.selected_index = self.matched_indices[idx]
-                self.stdscr.addstr(0, 0, 'NAME: %s' % \
-                        self.namelist[self.matched_indices[idx]],
-                        curses.color_pair(1))
-
-                self.set_mode(MODE_GRADE)
+                self.select_student(self.current_page()[idx])
+                return
 
+            elif ch in PAGE_KEYS:
+                self.turn_page(PAGE_KEYS[ch])
                 return
 
-        if len(self.buffer) > 2:
+        if raw_ch in (curses.KEY_NPAGE, curses.KEY_PPAGE):
+            self.turn_page([-1, 1][raw_ch == curses.KEY_NPAGE])
+            return
+
+        if self.buffer and self.buffer[0].isdigit():
+            self.lookup_id(''.join(self.buffer))
+        elif len(self.buffer) > 2:
             self.search_name(self.buffer)
-        else:
-            self.clear_lines(ROW_LIST, len(self.matched_indices),
-                    move_back=True)
+        elif self.matched_indices:
+            self.matched_indices = []
+            self.show_matches()
+
+    def lookup_id(self, key):
+        """List the student with the id `key` if it can be graded, or say
+        at once why not."""
+        idx = self.id_index.get(key, -1)
+        status = ''
+        if idx is None:
+            status = '[ID] %s is not unique, type the name' % key
+        elif idx in self.records:
+            status = '[ID] %s %s is already graded (:edit %s to amend)' % (
+                    key, self.namelist[idx], key)
+        elif idx != -1 and idx not in self.name_index.active:
+            status = '[ID] %s %s is not to be graded here' % (key,
+                    self.namelist[idx])
+
+        self.matched_indices = [idx] if idx != -1 and not status else []
+        self.match_page = 0
+        self.show_matches()
+        self.show_status(status)
+
+    def select_student(self, idx):
+        self.selected_index = idx
+        self.stdscr.addstr(0, 0, 'NAME: %s' % self.namelist[idx],
+                curses.color_pair(1))
+
+        self.set_mode(MODE_GRADE)
+
+    def read_key(self):
+        return self.stdscr.getch()
 
     def loop(self):
         while True:
             if not self.remain_indices:
                 self.destroy_screen()
+                self.cache(flush=True)
                 self.save()
                 return
 
-            raw_ch = self.stdscr.getch()
+            if self.instruments is None:
+                raw_ch = self.read_key()
+            else:
+                # getch() refreshes the screen first; do it apart so that
+                # the time spent waiting for the key is not counted.
+                self.instruments.end_key()
+                started = time.time()
+                self.stdscr.refresh()
+                self.instruments.record('refresh', started)
+                raw_ch = self.read_key()
+                self.instruments.begin_key(MODE_LABELS[self.mode])
+
             if raw_ch == ord('*'):
                 self.destroy_screen()
+                self.cache(flush=True)
+                self.stop_autosave()
                 sys.exit(0)
 
             if raw_ch == ord(':') and not self.command and \
@@ -257,39 +512,127 @@ class Grading:
             usr_cmd = ''.join(self.command[2:])
 
         if usr_cmd == '!!':
+            self.stop_autosave()
             self.rubric = []
             self.records = []
             self.remain_indices = range(len(self.namelist))
             self.destroy_screen()
-            os.remove('.%s.pickle' % self.subject)
+            self.journal.remove()
             print '> CACHE SWIPED!! Please start over again!'
             sys.exit(0)
 
         if REGEX_BNP.match(''.join(usr_cmd)) and \
                 self.selected_index != -1 and \
                 self.command[0] == MODE_GRADE:
-            match = REGEX_BNP.match(usr_cmd)
-            sign, num, pct_flag = match.groups()
-            if pct_flag == '%':
-                self.bonus_penalty[self.selected_index] = 1 + [-1,1][sign=='+'] * float(num)/100
-            else:
-                self.bonus_penalty[self.selected_index] = [-1,1][sign=='+'] * int(num)
+            self.set_adjustment(self.selected_index,
+                    parse_bonus_penalty(usr_cmd))
 
             self.show_status('[%s] %s / %s' % (
-                ['PENALTY', 'BONUS'][sign=='+'],
-                match.group(),
+                ['PENALTY', 'BONUS'][usr_cmd[0]=='+'],
+                usr_cmd,
                 self.namelist[self.selected_index]
                 ))
             self.mode = self.command[0]
             self.command = []
             return
 
+        if usr_cmd == 'stats':
+            self.stats_shown = not self.stats_shown
+            if self.stats_shown:
+                self.show_stats()
+            else:
+                for row in range(self.stats_top(), self.ROW_MAX):
+                    self.surface.draw(row, '')
+            self.show_matches()
+            self.mode = self.command[0]
+            self.command = []
+            self.show_status('')
+            return
+
+        if usr_cmd == 'edit' or usr_cmd.startswith('edit '):
+            # `:edit` reopens the last selected student, `:edit KEY` the
+            # graded student with the id or the name KEY.
+            key = usr_cmd[len('edit'):].strip()
+            prev_mode = self.command[0]
+            self.command = []
+            try:
+                if key:
+                    idx = self.resolve_recorded(key)
+                elif self.selected_index in self.records:
+                    idx = self.selected_index
+                else:
+                    raise ValueError('nothing recorded to edit')
+                self.edit_grade(idx)
+            except ValueError as e:
+                self.mode = prev_mode
+                self.show_status('[EDIT] %s' % e)
+            return
+
+        if usr_cmd.split(' ')[0] in CURVE_COMMANDS:
+            try:
+                self.change_curve(usr_cmd)
+                self.show_status('[CURVE] %s' % self.curve_report())
+            except ValueError as e:
+                self.show_status('[CURVE] %s' % e)
+            self.mode = self.command[0]
+            self.command = []
+            return
+
+        if usr_cmd == 'plot':
+            filename = '%s-summary.png' % self.name
+            try:
+                plot_summary(self.rubric, self.records, filename)
+                self.show_status('[PLOT] %s' % filename)
+            except ImportError as e:
+                self.show_status('[PLOT] %s' % e)
+            self.mode = self.command[0]
+            self.command = []
+            return
+
         # None matches?
         # Invalid command
         self.mode == self.command[0]
         self.command = []
         self.show_status('')
 
+    def change_curve(self, text):
+        """Add the bulk adjustment `text`, or drop the last one for `undo`,
+        and bring the export up to date.  `curve` alone lists them."""
+        if text == 'undo':
+            if not len(self.curve):
+                raise ValueError('nothing to undo')
+            self.curve.pop()
+        elif text != 'curve':
+            self.curve.push(parse_transform(text, self.rubric))
+
+        if text != 'curve':
+            with self.lock:
+                self.journal.save_curve(self.curve.specs())
+                if self.gradebook is not None:
+                    self.gradebook.set_curve(self.subject, self.curve.specs())
+                    self.gradebook.commit()
+                self.rewrite_export()
+
+    def curve_report(self):
+        return ' | '.join(self.curve.specs()) or 'no adjustments'
+
+    def edit_grade(self, idx):
+        """Reopen the recorded student `idx` in GRADE mode with the grades
+        recorded so far typed in."""
+        grades = self.records.grades(self.records.row_of(idx))
+        self.selected_index = idx
+        self.clear_lines(ROW_NAME, 1)
+        self.stdscr.addstr(ROW_NAME, 0, 'NAME: %s' % self.namelist[idx],
+                curses.color_pair(1))
+        self.set_mode(MODE_GRADE)
+
+        self.buffer = list(''.join('%g ' % grade for grade in grades))
+        self.entered = list(grades)
+        self.show_grade()
+        self.show_status('[EDIT] %s: %d/%d, Enter to keep or backspace to '
+                'change' % (self.namelist[idx],
+                    self.real_total(idx, grades), self.max_score))
+
     def show_rubric(self):
         padded_rubric = [str(self.rubric[x]).ljust(self.grade_spaces[x])
                 for x in range(len(self.rubric))]
@@ -298,8 +641,36 @@ class Grading:
             'RUBRIC: ' + ''.join(padded_rubric),
             curses.color_pair(COLOR_PAIR_PROMPT))
 
-    def show_grade(self, color=0):
-        bp = self.bonus_penalty[self.selected_index]
+    def show_stats(self):
+        """Draw the per-question statistics panel above the status line,
+        aligned with the rubric columns."""
+        columns = self.stats.columns()
+        spaces = self.grade_spaces + [len(str(self.max_score)) + 3]
+        top = self.stats_top()
+
+        rows = [
+            ['%.1f' % c.mean for c in columns],
+            ['%.1f' % c.sd for c in columns],
+            ['%g' % c.low for c in columns],
+            ['%g' % c.high for c in columns],
+            [columns[x].sparkline(spaces[x] - 1)
+                for x in range(len(columns))]]
+
+        yx = self.stdscr.getyx()
+        self.surface.draw(top, 'STATS:  n=%d  (last column: total)' % \
+                self.stats.n, curses.color_pair(COLOR_PAIR_PROMPT))
+        for x in range(len(STATS_LABELS)):
+            self.surface.draw(top + x + 1,
+                STATS_LABELS[x].ljust(8) + ''.join(
+                    [rows[x][y].ljust(spaces[y])
+                        for y in range(len(columns))]))
+        self.stdscr.move(*yx)
+
+    def stats_top(self):
+        return self.ROW_MAX - len(STATS_LABELS) - 1
+
+    def show_grade(self, color=0, suffix=''):
+        bp = self.records.adjustment(self.selected_index)
         bp_disp = ''
         if bp != 0:
             if type(bp) is float:
@@ -313,84 +684,20 @@ class Grading:
                     for x in range(len(grades)-1)]
             padded_grades.append(grades[-1])
 
-        self.clear_lines(ROW_GRADE, 1)
-        self.stdscr.addstr(ROW_GRADE, sum(self.grade_spaces)+8,
-                bp_disp)
-        self.stdscr.addstr(ROW_GRADE, 0, 
-            'GRADE:  ' + ''.join(padded_grades),
-            curses.color_pair(color))
+        grade_disp = 'GRADE:  ' + ''.join(padded_grades)
+        line = grade_disp
+        if bp_disp:
+            line = line.ljust(sum(self.grade_spaces)+8) + bp_disp
+        if suffix:
+            line += ' ' + suffix
 
-    def parse_grade(self):
-        raw_grades = ''.join(self.buffer).split(' ')
-        if len(raw_grades) > len(self.rubric):
-            self.buffer.pop()
-            return
+        self.surface.draw(ROW_GRADE, line, curses.color_pair(color))
+        self.stdscr.move(ROW_GRADE, min(len(grade_disp), self.COLUMN_MAX))
 
-        if raw_grades:
-            last_raw = raw_grades[-1]
-            idx = len(raw_grades) - 1
-            max = self.rubric[idx]
-
-            if last_raw.isdigit():
-                score = int(last_raw)
-                flag = self.check_score(score, max)
-                if flag == 1:
-                    self.buffer.append(' ')
-                elif flag == -1:
-                    curses.beep()
-                    for x in range(len(last_raw)):
-                        self.buffer.pop()
-            elif last_raw.startswith('.') and len(last_raw) > 1:
-                # pop out the .x form
-                score = int(last_raw[1:]) + 0.5
-                flag = self.check_score(score, max)
-                if flag == 1:
-                    for x in range(len(last_raw)):
-                        self.buffer.pop()
-                    
-                    self.buffer.extend(list(str(score)))
-                    self.buffer.append(' ')
-                elif flag == -1:
-                    curses.beep()
-                    for x in range(len(last_raw)):
-                        self.buffer.pop()
-            elif last_raw == '.':
-                return
-            else:
-                for x in range(len(last_raw)):
-                    self.buffer.pop()
-
-    def check_score(self, score, max):
-        l_max = len(str(max))
-
-        if int(score) < score:
-            # float score received
-            l_score = len(str(score)) - 2
-            if l_score > l_max or score > max:
-                return -1
-            if l_score == l_max and score < max:
-                return 1
-            if l_score < l_max and \
-                    int(str(score)[:-2])*10 <= max:
-                return 0
-
-            return 1
-        else:
-            l_score = len(str(score)) 
-            if l_score > l_max or score > max:
-                return -1
-            if l_score == l_max and score < max:
-                return 1
-
-            if l_score < l_max and \
-                    int(str(score)) * 10 <= max:
-                # check if the k-prefix is valid
-                return 0
-
-            return 1
-    
     def set_mode(self, mode):
         self.buffer = []
+        self.entry_states = []
+        self.entered = []
 
         if mode == MODE_NAME:
             self.mode = MODE_NAME
@@ -400,37 +707,57 @@ class Grading:
 
         elif mode == MODE_GRADE:
             self.mode = MODE_GRADE
-            self.clear_lines(ROW_LIST, len(self.matched_indices),
-                    move_back=True)
-
             self.matched_indices = []
-            self.clear_lines(ROW_GRADE, 1)
+            self.show_matches()
 
-            self.stdscr.addstr(ROW_GRADE, 0, 
-                'GRADE:  ')
+            self.surface.draw(ROW_GRADE, 'GRADE:  ')
+            self.stdscr.move(ROW_GRADE, len('GRADE:  '))
 
     def search_name(self, buffer):
-        regexs = [re.compile('(^|\s)%s' % component.upper()) 
-                for component in ''.join(buffer).split(' ')]
-
-        matched_indices = [idx for idx in self.remain_indices
-                if all(map(lambda x: x.search(self.namelist[idx]),
-                    regexs))]
-
-        if matched_indices:
-            yx = self.stdscr.getyx()
-            self.clear_lines(ROW_LIST, len(self.matched_indices))
-            self.stdscr.addstr(ROW_LIST, 0, '\n'.join(
-                ["%d. %s" % (idx+1, self.namelist[matched_indices[idx]])
-                    for idx in xrange(len(matched_indices))]),
-                curses.color_pair(2))
-
-            self.stdscr.move(*yx)
-        else:
-            self.clear_lines(ROW_LIST, len(self.matched_indices), 
-                    move_back=True)
-
-        self.matched_indices = matched_indices
+        self.matched_indices = self.name_index.search(''.join(buffer))
+        self.match_page = 0
+        self.show_matches()
+
+    def current_page(self):
+        first = self.match_page * self.page_size
+        return self.matched_indices[first:first+self.page_size]
+
+    def turn_page(self, step):
+        self.match_page += step
+        self.show_matches()
+
+    def show_matches(self):
+        """Draw the current page of `matched_indices` into the list pad.
+        Only one page is rendered however many students match, and only
+        the rows that changed are redrawn."""
+        bottom = self.stats_top() if self.stats_shown else self.ROW_MAX
+        height = max(1, bottom - ROW_LIST)
+        self.page_size = max(1, min(MATCH_PAGE, height - 1))
+
+        pages = max(1, (len(self.matched_indices) + self.page_size - 1) // \
+                self.page_size)
+        self.match_page = max(0, min(self.match_page, pages - 1))
+
+        page = self.current_page()
+        lines = ['%d. %s' % (x+1, self.namelist[page[x]])
+                for x in range(len(page))]
+        if pages > 1:
+            first = self.match_page * self.page_size
+            lines.append('-- %d-%d of %d, PgUp/PgDn for more --' % (
+                first + 1, first + len(page), len(self.matched_indices)))
+
+        attr = curses.color_pair(COLOR_PAIR_NAME)
+        for row in range(height):
+            self.list_surface.draw(row,
+                    lines[row] if row < len(lines) else '', attr)
+
+        if height != self.list_height:
+            self.list_pad.touchwin()
+            self.list_height = height
+        # Let the pad cover whatever stdscr holds below the grade row.
+        self.stdscr.noutrefresh()
+        self.list_pad.noutrefresh(0, 0, ROW_LIST, 0,
+                ROW_LIST + height - 1, self.COLUMN_MAX)
 
     def clear_lines(self, start, height, move_back=False):
         if move_back:
@@ -455,91 +782,451 @@ class Grading:
             self.stdscr.move(*yx)
 
     def load_cache(self):
-        if self.subject and os.path.exists('.%s.pickle' % self.subject):
-            fd = open('.%s.pickle' % self.subject, 'r')
-            self.rubric, self.remain_indices, \
-                self.records, self.bonus_penalty = pickle.load(fd)
+        state = self.journal.load() if self.subject else None
+        if state:
+            if len(state) == 4:
+                # Caches written before grades were stored by column.
+                rubric, remain_indices, records, bonus_penalty = state
+                records = RecordStore.from_lists(len(rubric), records,
+                        bonus_penalty)
+            else:
+                rubric, remain_indices, records = state
 
-            self.grade_spaces = map(
-                    lambda x: len(str(x)) + 3,
-                    self.rubric)
-            self.num_questions = len(self.rubric)
+            self.set_rubric(rubric)
+            self.remain_indices, self.records = remain_indices, records
 
-            self.mode = MODE_NAME
-            fd.close()
+            for kind, idx, values in self.journal.replay():
+                if kind == ENTRY_GRADE:
+                    self.records.put(idx, values)
+                    self.remain_indices.discard(idx)
+                elif kind == ENTRY_POINTS:
+                    self.records.set_adjustment(idx, int(values[0]))
+                elif kind == ENTRY_FACTOR:
+                    self.records.set_adjustment(idx, values[0])
+
+            self.name_index.reset(self.remain_indices)
 
     def cache(self, flush=False):
-        if len(self.records) % 2 == 0 or flush:
-            fd = open('.%s.pickle' % self.subject, 'w')
-            pickle.dump(
-                (self.rubric, self.remain_indices, 
-                    self.records, self.bonus_penalty),
-                fd)
-            fd.close()
+        if self.autosave is None:
+            self.persist(flush)
+        elif flush:
+            self.autosave.flush()
+        else:
+            self.autosave.request()
+
+    def persist(self, flush=True):
+        # Grades and bonus/penalty changes are already in the journal, or
+        # queued for it when autosaving; fold it into a fresh snapshot once
+        # it has grown long enough.
+        with self.lock:
+            entries = self.journal.take_pending()
+            state = None
+            if not self.journal.has_snapshot() or \
+                    self.journal.needs_compaction(len(self.records)):
+                # Taken after the queued entries were applied, so the
+                # snapshot covers them.
+                state = (self.rubric, self.remain_indices, self.records)
+                if self.autosave is not None:
+                    state = (self.rubric, set(self.remain_indices),
+                            self.records.copy())
+
+            if self.export_stale:
+                self.rewrite_export()
+            elif self.journal.deferred:
+                self.export.flush()
+            if self.gradebook is not None:
+                self.gradebook.commit()
+
+        if state is not None:
+            self.journal.compact(state)
+        else:
+            self.journal.write(entries)
+            self.journal.sync(force=flush)
+
+    def start_autosave(self):
+        """Move saving to a background thread, off the keystroke path."""
+        self.journal.deferred = True
+        self.autosave = Autosave(self.persist)
+        self.autosave.start()
+
+    def stop_autosave(self):
+        if self.autosave is not None:
+            self.autosave.stop()
+            self.autosave = None
+            self.journal.deferred = False
 
     def load_roster(self, filename='roster.txt'):
+        self.roster_file = filename
         if os.path.exists(filename):
-            entries = open(filename).readlines()
-            self.roster = [entry.strip().split('\t') for entry in entries]
-            self.namelist = [r[2] for r in self.roster]
-            self.remain_indices = set(range(len(self.namelist)))
-            self.bonus_penalty = [0] * len(self.namelist)
-            self.num_students = len(self.roster)
+            index = RosterIndex(filename)
+            self.roster_rebuilt = index.rebuilt
+            self.roster_header = index.header
+            self.roster = index.rows
+            self.namelist = index.names
+            if self.shard is None:
+                self.assigned = set(range(len(self.namelist)))
+            else:
+                self.assigned = set(self.shard.select(self.roster))
+            self.remain_indices = set(self.assigned)
+            self.num_students = len(self.assigned)
+
+            # Student id -> roster index; ids listed twice map to None.
+            self.id_index = index.id_index()
+            self.name_index = index.name_index(self.remain_indices)
         else:
             self.roster = None
 
-    def real_score(self, idx, score):
-        if idx >= len(self.bonus_penalty):
-            return score
-        bp = self.bonus_penalty[idx] 
-        if type(bp) is float:
-            score *= bp
-        elif type(bp) is int:
-            score += bp
+    def student_id(self, idx):
+        return self.roster[idx][0].strip()
+
+    def section_of(self, idx):
+        return self.roster[idx][1].strip() if len(self.roster[idx]) > 1 \
+                else ''
+
+    def real_total(self, idx, grades):
+        """Total of student `idx` with `grades` after bonus/penalty and the
+        bulk adjustments."""
+        if not len(self.curve):
+            return self.records.real_score(idx, sum(grades), self.max_score)
+        return self.curve.total(self.records, idx, grades)
+
+    def open_export(self):
+        q_title = ['q%d' % x for x in range(1, self.num_questions+1)] \
+                + ['bop', 'total']
+
+        self.export = CsvExport('%s.csv' % self.name,
+                self.roster_header + q_title)
+        self.rewrite_export()
+
+    def rewrite_export(self):
+        self.export_stale = False
+        if len(self.curve):
+            totals = self.curve.totals(self.records)
+        else:
+            totals = self.records.real_totals(self.max_score)
+        students = self.records.students
+        self.export.rewrite((students[row],
+            self.export_row(students[row], totals[row]))
+            for row in xrange(len(students)))
+
+    def export_row(self, idx, total=None):
+        grades = self.records.grades(self.records.row_of(idx))
+        if total is None:
+            total = self.real_total(idx, grades)
+        return [x.strip() for x in self.roster[idx]] + grades + \
+            [self.records.adjustment(idx), total]
+
+    def resolve_student(self, key):
+        """Find the remaining student with the id or the name `key`."""
+        if key in self.id_index:
+            idx = self.id_index[key]
+            if idx is None:
+                raise ValueError('student id %s is not unique' % key)
+        else:
+            matched = self.name_index.exact(key) or \
+                    self.name_index.search(key)
+            if len(matched) != 1:
+                raise ValueError('%s matches %d remaining students' % (
+                    key, len(matched)))
+            idx = matched[0]
+
+        if idx not in self.remain_indices:
+            if idx not in self.assigned:
+                raise ValueError('%s is not in %s' % (key, self.shard.tag))
+            raise ValueError('%s is already graded' % key)
+
+        return idx
+
+    def resolve_recorded(self, key):
+        """Find the graded student with the id or the name `key`."""
+        if key in self.id_index:
+            idx = self.id_index[key]
+            if idx is None:
+                raise ValueError('student id %s is not unique' % key)
+        else:
+            recorded = self.records.rows
+            matched = self.name_index.exact(key, recorded) or \
+                    self.name_index.search(key, recorded)
+            if len(matched) != 1:
+                raise ValueError('%s matches %d graded students' % (
+                    key, len(matched)))
+            idx = matched[0]
+
+        if idx not in self.records:
+            raise ValueError('%s is not graded yet' % key)
 
-        score = ceil(score)
-        score = self.max_score if score > self.max_score else score
-        score = 0 if score < 0 else score
+        return idx
+
+    def parse_score(self, raw_score, question):
+        score = self.automata[question].parse(raw_score)
+        if score is None:
+            raise ValueError('%s is not a score of 0-%d in steps of %g' % (
+                raw_score, self.rubric[question], self.step))
 
         return score
 
+    def parse_entry(self, fields):
+        if len(fields) not in (self.num_questions+1, self.num_questions+2):
+            raise ValueError('expected a name or id, %d scores and an '
+                    'optional bonus/penalty' % self.num_questions)
+
+        idx = self.resolve_student(fields[0])
+        grades = [self.parse_score(fields[x+1], x)
+                for x in range(self.num_questions)]
+
+        bp = None
+        if len(fields) > self.num_questions + 1 and fields[-1]:
+            bp = parse_bonus_penalty(fields[-1])
+            if bp is None:
+                raise ValueError('invalid bonus/penalty %s' % fields[-1])
+
+        return idx, grades, bp
+
+    def ingest(self, fd, batch_size=INGEST_BATCH):
+        """Record `name-or-id, q1..qn[, bonus]` lines read from `fd` without
+        the curses interface, committing them in batches.  Rejected lines
+        are reported on stderr."""
+        self.prepare()
+        accepted = rejected = 0
+
+        lineno = 0
+        for fields in csv.reader(fd):
+            lineno += 1
+            fields = [x.strip() for x in fields]
+            if not fields or not fields[0] or fields[0].startswith('#'):
+                continue
+
+            try:
+                idx, grades, bp = self.parse_entry(fields)
+            except ValueError as e:
+                print >> sys.stderr, '[REJECTED] line %d: %s' % (lineno, e)
+                rejected += 1
+                continue
+
+            if bp is not None:
+                self.set_adjustment(idx, bp, flush=False)
+            self.commit_grade(idx, grades, flush=False)
+
+            accepted += 1
+            if accepted % batch_size == 0:
+                self.export.flush()
+                self.cache()
+
+        self.cache(flush=True)
+        self.save()
+
+        return accepted, rejected
+
     def save(self):
-        raw_data = [self.roster[r[0]] + r[1:] + \
-            [self.bonus_penalty[r[0]]] + \
-            [sum(r[1:])]
-            for r in self.records]
-
-        for d in raw_data:
-            d[-1] = self.real_score(int(d[0]), d[-1])
-
-        merged_data = [','.join(map(lambda x: str(x) \
-                if type(x) in (float, int) \
-                or (type(x) is str and x.isdigit())\
-                else '"%s"' % x.strip(), 
-                r))
-                for r in raw_data]
-
-        q_title = ['"q%d"' % x for x in range(1, self.num_questions+1)] \
-                + ['"bop"', '"total"']
-
-        fd = open('%s.csv' % self.subject, 'w+')
-        fd.write('"id","section","name","major","comajor","year","credit",')
-        fd.write(','.join(q_title) + '\n')
-        fd.write('\n'.join(merged_data))
-        fd.close()
+        # Rows are exported as they are recorded, so the CSV file only
+        # needs to be closed here once the last autosave is done.
+        self.stop_autosave()
+        if len(self.curve):
+            # Totals curved against the whole class change as it is
+            # graded.
+            self.rewrite_export()
+        self.export.close()
 
 def main():
-    if len(sys.argv) > 1:
-        grading = Grading(sys.argv[1])
+    parser = argparse.ArgumentParser()
+    parser.add_argument('subject')
+    parser.add_argument('--rubric',
+            help='maximum score of each question, e.g. "5 10 10"')
+    parser.add_argument('--plot', action='store_true',
+            help='plot the per-question statistics of the subject into '
+                '<subject>-summary.png and exit')
+    parser.add_argument('--ingest', metavar='FILE',
+            help='record "name-or-id, q1..qn[, bonus]" lines from FILE '
+                '(- for stdin) without the curses interface')
+    parser.add_argument('--roster', default='roster.txt',
+            help='tab separated roster, or a course sheet (CSV or tab '
+                'delimited, e.g. downloaded from Blackboard) with id, name '
+                'and optionally section columns (default: %(default)s)')
+    parser.add_argument('--step', type=float, default=DEFAULT_STEP,
+            help='granularity of the scores; with the default of %(default)s '
+                '.x stands for x.5, other steps are typed as decimals '
+                '(e.g. 3.25 with --step 0.25)')
+    parser.add_argument('--curve', metavar='ADJUSTMENT', action='append',
+            help='apply a bulk adjustment to the totals of the subject and '
+                'rewrite its export: "curve linear A [B]", "curve pct P", '
+                '"section S BP", "giveback Q N", or "undo" to drop the last '
+                'one.  May be repeated.')
+    parser.add_argument('--db', metavar='GRADEBOOK',
+            help='also record grades into the SQLite gradebook GRADEBOOK')
+    parser.add_argument('--profile', metavar='FILE', nargs='?', const='',
+            help='time keystrokes and handlers and write a summary to FILE '
+                '(default: <subject>-profile.txt) at exit; also enabled by '
+                'setting %s' % PROFILE_ENV)
+    parser.add_argument('--cprofile', metavar='FILE',
+            help='dump cProfile statistics of the whole session to FILE, '
+                'to be read with pstats')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--serve', metavar='SOCKET', nargs='?', const='',
+            help='hold the session for several graders connecting to the '
+                'UNIX socket SOCKET (default: .<subject>.sock)')
+    group.add_argument('--connect', metavar='SOCKET', nargs='?', const='',
+            help='grade in the session served at SOCKET (default: '
+                '.<subject>.sock)')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--shard', metavar='K/N',
+            help='grade only the K-th of N contiguous parts of the roster')
+    group.add_argument('--section', metavar='S[,S...]',
+            help='grade only the students of the given sections')
+    args = parser.parse_args()
+
+    shard = None
+    try:
+        if args.shard:
+            shard = IndexShard(args.shard)
+        elif args.section:
+            shard = SectionShard(args.section)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if not 0 < args.step <= 1 or 1 / args.step != int(1 / args.step):
+        parser.error('--step must divide 1, e.g. 0.5 or 0.25')
+
+    gradebook = Gradebook(args.db) if args.db else None
+
+    rubric = None
+    if args.rubric:
+        rubric = parse_rubric(args.rubric)
+        if not rubric:
+            parser.error('invalid rubric: %s' % args.rubric)
+
+    instruments = None
+    profile = args.profile
+    if profile is None and os.environ.get(PROFILE_ENV):
+        profile = os.environ[PROFILE_ENV]
+        profile = '' if profile == '1' else profile
+    if profile is not None:
+        instruments = Instruments()
+        profile = profile or '%s-profile.txt' % session_name(args.subject,
+                shard)
+
+    profiler = None
+    if args.cprofile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        run(parser, args, shard, rubric, gradebook, instruments)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.cprofile)
+            print '[PROFILE] cProfile statistics in %s' % args.cprofile
+        if instruments is not None:
+            instruments.write(profile)
+            print '[PROFILE] timings in %s' % profile
+
+def run(parser, args, shard, rubric, gradebook, instruments):
+    if args.plot:
+        grading = Grading(args.subject, interactive=False, shard=shard,
+                roster=args.roster)
+        if not grading.rubric:
+            parser.error('nothing recorded for %s yet' % args.subject)
+        try:
+            plot_summary(grading.rubric, grading.records,
+                    '%s-summary.png' % grading.name)
+        except ImportError as e:
+            print '[PLOT] %s' % e
+            sys.exit(1)
+        print '[PLOT] %s-summary.png' % grading.name
+        return
+
+    if args.curve:
+        grading = Grading(args.subject, interactive=False, shard=shard,
+                gradebook=gradebook, roster=args.roster, step=args.step)
+        if not grading.rubric:
+            parser.error('nothing recorded for %s yet' % args.subject)
         try:
-            grading.loop()
+            grading.prepare()
+            for text in args.curve:
+                grading.change_curve(text)
+        except ValueError as e:
+            parser.error(str(e))
+        grading.save()
+        print '[CURVE] %s' % grading.curve_report()
+        return
+
+    if args.ingest:
+        grading = Grading(args.subject, rubric=rubric, interactive=False,
+                shard=shard, gradebook=gradebook, instruments=instruments,
+                roster=args.roster, step=args.step)
+        if not grading.rubric:
+            parser.error('--ingest needs --rubric for a new subject')
+        if rubric and rubric != grading.rubric:
+            parser.error('cached rubric %s differs from --rubric' % \
+                    ' '.join(map(str, grading.rubric)))
+
+        fd = sys.stdin if args.ingest == '-' else open(args.ingest)
+        try:
+            accepted, rejected = grading.ingest(fd)
+        except ValueError as e:
+            parser.error(str(e))
+        print '[INGEST] %d recorded, %d rejected // [%d/%d]' % (
+                accepted, rejected, len(grading.records),
+                grading.num_students)
+        return
+
+    if args.serve is not None:
+        grading = Grading(args.subject, rubric=rubric, interactive=False,
+                shard=shard, gradebook=gradebook, instruments=instruments,
+                roster=args.roster, step=args.step)
+        if not grading.rubric:
+            parser.error('--serve needs --rubric for a new subject')
+        if rubric and rubric != grading.rubric:
+            parser.error('cached rubric %s differs from --rubric' % \
+                    ' '.join(map(str, grading.rubric)))
+
+        try:
+            grading.prepare()
+            server = GradeServer(grading,
+                    args.serve or socket_name(grading.name))
+            server.listen()
+        except ValueError as e:
+            parser.error(str(e))
+        print '[SERVE] %s on %s // [%d/%d]' % (grading.name, server.path,
+                len(grading.records), grading.num_students)
+        try:
+            server.serve_forever()
         except KeyboardInterrupt:
-            grading.destroy_screen()
-            grading.cache(flush=True)
-            grading.save()
-            sys.exit(0)
-    else:
-        print 'Usage: %s [objname]' % sys.argv[0]
+            pass
+        finally:
+            server.close()
+        return
+
+    if args.connect is not None:
+        # client imports this module, so it is only loaded when needed.
+        from client import RemoteGrading, connect
+        try:
+            connection, state, backlog = connect(args.connect or
+                    socket_name(session_name(args.subject, shard)))
+        except ValueError as e:
+            parser.error(str(e))
+        if state['subject'] != args.subject:
+            parser.error('the server grades %s' % state['subject'])
+
+    try:
+        if args.connect is not None:
+            grading = RemoteGrading(args.subject, connection, state,
+                    backlog, instruments=instruments)
+        else:
+            grading = Grading(args.subject, rubric=rubric, shard=shard,
+                    gradebook=gradebook, instruments=instruments,
+                    roster=args.roster, step=args.step)
+    except ValueError as e:
+        parser.error(str(e))
+
+    try:
+        grading.loop()
+    except KeyboardInterrupt:
+        grading.destroy_screen()
+        grading.cache(flush=True)
+        grading.save()
+        sys.exit(0)
 
 if __name__ == "__main__":
     main()
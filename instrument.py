@@ -0,0 +1,138 @@
+import time
+import heapq
+from array import array
+
+PROFILE_ENV = 'GRADING_PROFILE'
+
+RING_SIZE = 4096
+SLOWEST = 10
+# Histogram buckets are powers of two of microseconds: <1us, <2us, ...
+HIST_BUCKETS = 24
+
+class EventStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * HIST_BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        bucket = min(int(seconds * 1e6).bit_length(), HIST_BUCKETS - 1)
+        self.histogram[bucket] += 1
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile."""
+        rank = p * self.count / 100.0
+        seen = 0
+        for bucket in xrange(HIST_BUCKETS):
+            seen += self.histogram[bucket]
+            if seen >= rank:
+                return min((1 << bucket) / 1e6, self.max)
+        return self.max
+
+def format_time(seconds):
+    if seconds >= 1:
+        return '%.2fs' % seconds
+    if seconds >= 1e-3:
+        return '%.1fms' % (seconds * 1e3)
+    return '%.0fus' % (seconds * 1e6)
+
+class Instruments:
+    """Per-event timings of a grading session.
+
+    Every event is counted into a per-name log2 histogram and written into
+    a ring buffer holding the last `size` events; recording one is a couple
+    of list stores and a dict lookup, so it can stay on the keystroke
+    path."""
+
+    def __init__(self, size=RING_SIZE):
+        self.started = time.time()
+        self.stats = {}
+        self.names = [None] * size
+        self.durations = array('d', [0.0]) * size
+        self.stamps = array('d', [0.0]) * size
+        self.next = 0
+
+        self.key = None
+
+    def record(self, name, started, now=None):
+        if now is None:
+            now = time.time()
+        slot = self.next % len(self.names)
+        self.names[slot] = name
+        self.durations[slot] = now - started
+        self.stamps[slot] = started - self.started
+        self.next += 1
+
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = EventStats()
+        stats.add(now - started)
+
+    def wrap(self, obj, methods, prefix=''):
+        """Time every call of the given methods of `obj`."""
+        for name in methods:
+            setattr(obj, name, self.timed(prefix + name, getattr(obj, name)))
+
+    def timed(self, name, func):
+        def timed(*args, **kwargs):
+            started = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, started)
+        return timed
+
+    def begin_key(self, label):
+        self.key = (label, time.time())
+
+    def end_key(self):
+        """Record the handling of the key since `begin_key`."""
+        if self.key is not None:
+            self.record('key:%s' % self.key[0], self.key[1])
+            self.key = None
+
+    def slowest(self, n=SLOWEST):
+        kept = min(self.next, len(self.names))
+        return heapq.nlargest(n, ((self.durations[x], self.stamps[x],
+            self.names[x]) for x in xrange(kept)))
+
+    def summary(self):
+        lines = ['%d events in %s' % (self.next,
+            format_time(time.time() - self.started)), '']
+        lines.append('%-24s %8s %9s %9s %9s %9s %9s' % ('event', 'count',
+            'total', 'mean', 'p50', 'p99', 'max'))
+        for name, stats in sorted(self.stats.items(),
+                key=lambda item: -item[1].total):
+            lines.append('%-24s %8d %9s %9s %9s %9s %9s' % (name, stats.count,
+                format_time(stats.total),
+                format_time(stats.total / stats.count),
+                format_time(stats.percentile(50)),
+                format_time(stats.percentile(99)),
+                format_time(stats.max)))
+
+        lines.extend(['', 'p50 and p99 are rounded up to the histogram '
+            'buckets below.', '',
+            'histograms (count per <1us, <2us, <4us, ...):'])
+        for name in sorted(self.stats):
+            histogram = self.stats[name].histogram
+            last = max(x for x in xrange(HIST_BUCKETS) if histogram[x])
+            lines.append('%-24s %s' % (name,
+                ' '.join(map(str, histogram[:last+1]))))
+
+        lines.extend(['', 'slowest of the last %d events:' % min(self.next,
+            len(self.names))])
+        for seconds, stamp, name in self.slowest():
+            lines.append('  %9s  %-24s at +%.3fs' % (format_time(seconds),
+                name, stamp))
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename):
+        fd = open(filename, 'w')
+        fd.write(self.summary())
+        fd.close()
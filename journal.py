@@ -0,0 +1,173 @@
+import os
+import struct
+import cPickle as pickle
+
+ENTRY_GRADE, ENTRY_POINTS, ENTRY_FACTOR = 'G', 'P', 'F'
+
+# kind, student index, number of doubles that follow
+HEADER = struct.Struct('<cIH')
+
+SYNC_EVERY = 16
+COMPACT_EVERY = 256
+
+class Journal:
+    """Snapshot plus append-only journal of a grading session.
+
+    The snapshot `.<name>.pickle` holds the whole session state, the journal
+    `.<name>.journal` one binary entry per recorded grade or bonus/penalty
+    change made since.  Entries are fsync'ed every `sync_every` appends and
+    folded into a fresh snapshot once the journal grows as long as the
+    session itself (or `compact_every` entries, whichever is larger).
+    The bulk adjustments of the session are kept apart in `.<name>.curve`,
+    one per line.
+
+    A deferred journal only queues appended entries; they reach the file
+    through `take_pending` and `write`, e.g. from a background writer."""
+
+    def __init__(self, name, sync_every=SYNC_EVERY,
+            compact_every=COMPACT_EVERY, deferred=False):
+        self.snapshot_file = '.%s.pickle' % name
+        self.journal_file = '.%s.journal' % name
+        self.curve_file = '.%s.curve' % name
+        self.sync_every = sync_every
+        self.compact_every = compact_every
+
+        self.fd = None
+        self.entries = 0
+        self.unsynced = 0
+        self.deferred = deferred
+        self.pending = []
+
+    def has_snapshot(self):
+        return os.path.exists(self.snapshot_file)
+
+    def load(self):
+        """Return the state saved in the snapshot, or None without one.
+        Entries journaled since then are yielded by `replay`."""
+        if not self.has_snapshot():
+            return None
+
+        fd = open(self.snapshot_file, 'rb')
+        state = pickle.load(fd)
+        fd.close()
+
+        return state
+
+    def replay(self):
+        """Yield the `(kind, student, values)` entries journaled since the
+        snapshot."""
+        if not os.path.exists(self.journal_file):
+            return
+
+        fd = open(self.journal_file, 'rb')
+        data = fd.read()
+        fd.close()
+
+        offset = 0
+        while offset + HEADER.size <= len(data):
+            kind, idx, count = HEADER.unpack_from(data, offset)
+            end = offset + HEADER.size + 8 * count
+            if end > len(data):
+                break
+
+            values = list(struct.unpack_from('<%dd' % count, data,
+                offset + HEADER.size))
+            offset = end
+            self.entries += 1
+            yield kind, idx, values
+
+        if offset < len(data):
+            # Drop the entry torn by a crash so that appends stay aligned.
+            fd = open(self.journal_file, 'r+b')
+            fd.truncate(offset)
+            fd.close()
+
+    def append(self, kind, idx, values):
+        entry = HEADER.pack(kind, idx, len(values)) + \
+                struct.pack('<%dd' % len(values), *values)
+        self.entries += 1
+        if self.deferred:
+            self.pending.append(entry)
+        else:
+            self.write([entry])
+
+    def take_pending(self):
+        entries, self.pending = self.pending, []
+        return entries
+
+    def write(self, entries):
+        if not entries:
+            return
+        if self.fd is None:
+            self.fd = open(self.journal_file, 'ab')
+
+        self.fd.write(''.join(entries))
+        self.fd.flush()
+        self.unsynced += len(entries)
+
+    def append_grade(self, idx, grades):
+        self.append(ENTRY_GRADE, idx, grades)
+
+    def append_adjustment(self, idx, bp):
+        if type(bp) is float:
+            self.append(ENTRY_FACTOR, idx, [bp])
+        else:
+            self.append(ENTRY_POINTS, idx, [float(bp)])
+
+    def sync(self, force=False):
+        if self.fd is None or not self.unsynced:
+            return
+
+        if force or self.unsynced >= self.sync_every:
+            os.fsync(self.fd.fileno())
+            self.unsynced = 0
+
+    def needs_compaction(self, num_records):
+        return self.entries >= max(self.compact_every, num_records)
+
+    def compact(self, state):
+        """Write `state` as the new snapshot and start an empty journal."""
+        tmp_file = self.snapshot_file + '.tmp'
+        fd = open(tmp_file, 'wb')
+        pickle.dump(state, fd, pickle.HIGHEST_PROTOCOL)
+        fd.flush()
+        os.fsync(fd.fileno())
+        fd.close()
+        os.rename(tmp_file, self.snapshot_file)
+
+        self.close()
+        open(self.journal_file, 'wb').close()
+        # Entries queued since `state` was taken still have to be written.
+        self.entries = len(self.pending)
+        self.unsynced = 0
+
+    def load_curve(self):
+        if not os.path.exists(self.curve_file):
+            return []
+        fd = open(self.curve_file)
+        specs = [line.strip() for line in fd if line.strip()]
+        fd.close()
+        return specs
+
+    def save_curve(self, specs):
+        tmp_file = self.curve_file + '.tmp'
+        fd = open(tmp_file, 'w')
+        fd.write(''.join(spec + '\n' for spec in specs))
+        fd.flush()
+        os.fsync(fd.fileno())
+        fd.close()
+        os.rename(tmp_file, self.curve_file)
+
+    def close(self):
+        if self.fd is not None:
+            self.sync(force=True)
+            self.fd.close()
+            self.fd = None
+
+    def remove(self):
+        self.pending = []
+        self.close()
+        for filename in (self.snapshot_file, self.journal_file,
+                self.curve_file):
+            if os.path.exists(filename):
+                os.remove(filename)
@@ -1,8 +1,25 @@
 #!/usr/bin/env python
 
+import os
 import sys
+import heapq
+import itertools
+import argparse
 import readline
-import re
+
+from gradebook import Gradebook
+from nameindex import NameIndex, tokenize, soundex, trigrams
+from roster import SheetWriter, read_rows, detect_columns, sheet_format
+
+# A fuzzy match is taken when its confidence reaches FUZZY_THRESHOLD and
+# beats the runner-up by FUZZY_MARGIN; otherwise the best FUZZY_TOP
+# candidates are only listed next to the miss.
+FUZZY_THRESHOLD = 0.6
+FUZZY_MARGIN = 0.1
+FUZZY_TOP = 3
+# Share of the confidence given to trigram similarity, the rest goes to
+# matching Soundex codes.
+FUZZY_TRIGRAM_WEIGHT = 0.7
 
 def get_index(max_index):
     while True:
@@ -33,59 +50,315 @@ def select_columns(grade, sheet):
 
     return from_col, to_col
 
-def merge(grade, g_col, sheet, s_col):
-    hit_cnt = 0
-    miss_cnt = 0
-    for x in range(len(sheet)):
-        row = sheet[x]
-        hit_flag = False
-        for record in grade:
-            name = record[2].replace('"', '')
-            components = re.split('-| ', 
-                    row[0].replace('"', '').upper()) + \
-                re.split('-| ', row[1].replace('"', '').upper())
-            
-            if not filter(lambda x: not x, 
-                [re.compile(comp).search(name) 
-                    for comp in components]):
-
-                print '[HIT]', ' '.join(components), '->', name, ' = ', record[g_col]
-                hit_cnt += 1
-
-                row[s_col] = str(int(float(record[g_col])))
-                hit_flag = True
-                break
-
-        if not hit_flag:
-            print '[MISS]', ' '.join(components) 
-            miss_cnt += 1
-            row[s_col] = '0'
-
-    print 'HIT:', hit_cnt, 'MISS:', miss_cnt
-
-    return sheet
+class NameMatcher:
+    """Token prefix index over the names of a score report.
+
+    A sheet row matches a record when every part of its first and last name
+    is the prefix of a token of the record's name, so "Chris" still finds
+    CHRISTOPHER SMITH."""
+
+    def __init__(self, grade, name_col=2):
+        self.grade = grade
+        self.index = NameIndex([record[name_col] for record in grade])
+        self.token_sets = [frozenset(tokens) for tokens in self.index.tokens]
+        self.fuzzy = None
+        # Records already given to a sheet row, left out of fuzzy matches.
+        self.used = set()
+
+    def resolve(self, components):
+        """Return the indices of the records matching all `components`."""
+        if not components:
+            return []
+
+        matched = self.index.narrow(None, components)
+        if len(matched) > 1:
+            # A record carrying exactly the same name settles the tie, then
+            # one carrying every part as a whole token.
+            comps = set(components)
+            for same in (lambda tokens: tokens == comps,
+                    lambda tokens: comps <= tokens):
+                exact = [idx for idx in matched if same(self.token_sets[idx])]
+                if len(exact) == 1:
+                    return exact
+
+        return sorted(matched)
+
+    def suggest(self, components):
+        """Return the best fuzzy candidates for a name with no match."""
+        if not components:
+            return []
+        if self.fuzzy is None:
+            self.fuzzy = FuzzyIndex(self.token_sets)
+        return self.fuzzy.search(components, exclude=self.used)
+
+    def resolve_fuzzy(self, components):
+        """Return `(index, candidates)`, `index` being the fuzzy match or
+        None when no candidate is confident and clear enough."""
+        candidates = self.suggest(components)
+        if candidates and candidates[0][0] >= FUZZY_THRESHOLD and \
+                (len(candidates) == 1 or
+                    candidates[0][0] - candidates[1][0] >= FUZZY_MARGIN):
+            return candidates[0][1], candidates
+        return None, candidates
+
+class FuzzyIndex:
+    """Trigram and Soundex postings over the names of a score report, for
+    names that differ from the sheet by typos or spelling.
+
+    Only records sharing a trigram or a Soundex code with the query are
+    scored, so a lookup costs the length of its postings rather than the
+    size of the report."""
+
+    def __init__(self, token_sets):
+        self.grams = []
+        self.sounds = []
+        self.gram_postings = {}
+        self.sound_postings = {}
+        for idx in xrange(len(token_sets)):
+            grams = trigrams(token_sets[idx])
+            sounds = set(soundex(token) for token in token_sets[idx])
+            self.grams.append(grams)
+            self.sounds.append(sounds)
+            for gram in grams:
+                self.gram_postings.setdefault(gram, []).append(idx)
+            for sound in sounds:
+                self.sound_postings.setdefault(sound, []).append(idx)
+
+    def search(self, components, k=FUZZY_TOP, exclude=()):
+        """Return up to `k` `(confidence, index)` pairs, best first,
+        leaving out the indices in `exclude`."""
+        grams = trigrams(components)
+        sounds = set(soundex(comp) for comp in components)
+
+        shared = {}
+        for gram in grams:
+            for idx in self.gram_postings.get(gram, ()):
+                shared[idx] = shared.get(idx, 0) + 1
+        for sound in sounds:
+            for idx in self.sound_postings.get(sound, ()):
+                shared.setdefault(idx, 0)
+
+        def confidence(idx):
+            dice = 2.0 * shared[idx] / (len(grams) + len(self.grams[idx]))
+            phonetic = float(len(sounds & self.sounds[idx])) / \
+                    max(len(sounds), len(self.sounds[idx]))
+            return FUZZY_TRIGRAM_WEIGHT * dice + \
+                    (1 - FUZZY_TRIGRAM_WEIGHT) * phonetic
+
+        return heapq.nlargest(k, ((confidence(idx), idx) for idx in shared
+            if idx not in exclude))
+
+def sheet_components(row, name_cols=(0, 1)):
+    components = []
+    for col in name_cols:
+        components.extend(tokenize(row[col]))
+    return components
+
+def sheet_name_columns(header):
+    """Find the name column(s) of a sheet, Blackboard's last name and
+    first name columns by default."""
+    columns = detect_columns(header)
+    if columns is None:
+        return (0, 1)
+    if columns['name'] is not None:
+        return (columns['name'],)
+    return (columns['last'], columns['first'])
+
+def format_score(raw):
+    score = float(raw)
+    return str(int(score)) if score == int(score) else str(score)
+
+def merge_reports(reports, sheet, fuzzy=True, name_cols=(0, 1),
+        names=None):
+    """Fill the sheet rows from several score reports in one pass, yielding
+    each row once filled.  `reports` lists `(label, grade, [(g_col, s_col),
+    ...])`; each sheet row is matched once per report and all of its columns
+    are filled from that match.  Names without any exact match fall back to
+    a fuzzy match if `fuzzy`, among the records that no sheet row matches
+    exactly nor took before.
+
+    `names` yields the name parts of every sheet row, read ahead of the
+    rows themselves so that the exact matches are known before the first
+    fuzzy one; without it the sheet is read into memory."""
+    matchers = [NameMatcher(grade) for label, grade, columns in reports]
+    counts = [[0, 0, 0, 0] for report in reports]
+    if fuzzy:
+        if names is None:
+            sheet = list(sheet)
+            names = (sheet_components(row, name_cols) for row in sheet)
+        for components in names:
+            for matcher in matchers:
+                matched = matcher.resolve(components)
+                if len(matched) == 1:
+                    matcher.used.add(matched[0])
+
+    for row in sheet:
+        components = sheet_components(row, name_cols)
+        for x in xrange(len(reports)):
+            label, grade, columns = reports[x]
+            prefix = '[%s]' % label if label else ''
+            matched = matchers[x].resolve(components)
+            status = '[HIT]'
+            candidates = []
+            if not matched and fuzzy:
+                idx, candidates = matchers[x].resolve_fuzzy(components)
+                if idx is not None:
+                    matched = [idx]
+                    status = '[FUZZY %.2f]' % candidates[0][0]
+
+            if len(matched) == 1:
+                if status != '[HIT]':
+                    matchers[x].used.add(matched[0])
+                record = grade[matched[0]]
+                name = record[2].replace('"', '')
+                print prefix + status, ' '.join(components), '->', name, \
+                        ' = ', ' '.join([record[g_col] for g_col, s_col
+                            in columns])
+                counts[x][[0, 3][status != '[HIT]']] += 1
+
+                for g_col, s_col in columns:
+                    row[s_col] = format_score(record[g_col])
+                continue
+
+            if matched:
+                print prefix + '[AMBIGUOUS]', ' '.join(components), '->', \
+                        ' | '.join([grade[idx][2].replace('"', '')
+                            for idx in matched])
+                counts[x][2] += 1
+            else:
+                print prefix + '[MISS]', ' '.join(components), ' '.join(
+                        ['?? %s (%.2f)' % (grade[idx][2].replace('"', ''),
+                            score) for score, idx in candidates])
+                counts[x][1] += 1
+            for g_col, s_col in columns:
+                row[s_col] = '0'
+
+        yield row
+
+    for x in xrange(len(reports)):
+        print (reports[x][0] + ' ' if reports[x][0] else '') + \
+                'HIT: %d MISS: %d AMBIGUOUS: %d FUZZY: %d' % tuple(counts[x])
+
+def merge(grade, g_col, sheet, s_col, fuzzy=True, name_cols=(0, 1),
+        names=None):
+    return merge_reports([(None, grade, [(g_col, s_col)])], sheet, fuzzy,
+            name_cols, names)
+
+def load_report(gradebook, assignment):
+    header, rows = gradebook.report(assignment)
+    return [header] + [map(str, row) for row in rows]
+
+def find_column(header, column):
+    """Resolve a column given by its 1-based number or its title."""
+    titles = [x.replace('"', '').strip() for x in header]
+    if column.isdigit() and 0 < int(column) <= len(header):
+        return int(column) - 1
+    if column in titles:
+        return titles.index(column)
+    raise ValueError('no column %s' % column)
+
+def parse_mapping(spec):
+    """Split `REPORT:COLUMN=SHEET_COLUMN` into its three parts."""
+    source, sep, target = spec.partition('=')
+    report, sep2, column = source.rpartition(':')
+    if not sep or not sep2 or not report or not column or not target:
+        raise ValueError('invalid mapping %s, expected '
+                'REPORT:COLUMN=SHEET_COLUMN' % spec)
+    return report.strip(), column.strip(), target.strip()
+
+def read_mapping_file(filename):
+    specs = []
+    for line in open(filename):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            specs.append(line)
+    return specs
 
 def main():
-    if len(sys.argv) != 3:
-        print 'Usage: %s score_report grading_sheet' % sys.argv[0]
-        sys.exit(1)
-
-    sheet = [x.strip().split(',') 
-            for x in open(sys.argv[2]).readlines()]
-    grade = [x.strip().split(',') 
-            for x in open(sys.argv[1]).readlines()]
-
-    sheet_entries = sheet[0]
-    grade_entries = grade[0]
-
-    from_col, to_col = select_columns(grade_entries, sheet_entries)
-    merged_sheet = merge(grade[1:], from_col, 
-            sheet[1:], to_col)
-
-    fd = open('final_%s' % sys.argv[2], 'w+')
-    fd.write(','.join(sheet_entries) + '\n')
-    fd.write('\n'.join([','.join(row) for row in merged_sheet]))
-    fd.close()
+    parser = argparse.ArgumentParser(
+            description='Merge scores into a grading sheet, prompting for '
+                'the columns unless mappings are given.')
+    parser.add_argument('score_report', nargs='?',
+            help='score CSV (or gradebook assignment) for the interactive '
+                'mode')
+    parser.add_argument('grading_sheet')
+    parser.add_argument('--db', metavar='GRADEBOOK',
+            help='score reports name assignments of the SQLite gradebook')
+    parser.add_argument('-m', '--map', metavar='REPORT:COLUMN=SHEET_COLUMN',
+            action='append', default=[],
+            help='fill SHEET_COLUMN from COLUMN of REPORT; columns are '
+                'titles or 1-based numbers.  May be repeated.')
+    parser.add_argument('--map-file', metavar='FILE',
+            help='read mappings from FILE, one per line')
+    parser.add_argument('--no-fuzzy', dest='fuzzy', action='store_false',
+            help='leave names without an exact match unmerged instead of '
+                'trying a fuzzy match')
+    args = parser.parse_args()
+
+    gradebook = Gradebook(args.db) if args.db else None
+    specs = args.map + (read_mapping_file(args.map_file)
+            if args.map_file else [])
+    if not specs and not args.score_report:
+        parser.error('give a score report or --map/--map-file')
+    if specs and args.score_report:
+        parser.error('a score report cannot be combined with mappings')
+
+    # The sheet is streamed: only the score reports are held in memory.
+    sheet = (row for row in read_rows(args.grading_sheet) if row)
+    sheet_entries = next(sheet, None)
+    if sheet_entries is None:
+        parser.error('%s is empty' % args.grading_sheet)
+    name_cols = sheet_name_columns(sheet_entries)
+    # A second, cheap pass over the name columns only, for the fuzzy
+    # matching to know which records have an exact owner further down.
+    names = (sheet_components(row, name_cols) for row in itertools.islice(
+        (row for row in read_rows(args.grading_sheet) if row), 1, None))
+
+    reports = {}
+    def report(name):
+        if name not in reports:
+            if gradebook is None:
+                reports[name] = [row for row in read_rows(name) if row]
+            else:
+                try:
+                    reports[name] = load_report(gradebook, name)
+                except KeyError:
+                    parser.error('no assignment %s in %s' % (
+                        name, gradebook.filename))
+        return reports[name]
+
+    if specs:
+        columns = {}
+        order = []
+        try:
+            for spec in specs:
+                name, column, target = parse_mapping(spec)
+                g_col = find_column(report(name)[0], column)
+                s_col = find_column(sheet_entries, target)
+                if name not in columns:
+                    columns[name] = []
+                    order.append(name)
+                columns[name].append((g_col, s_col))
+        except ValueError as e:
+            parser.error(str(e))
+
+        merged_sheet = merge_reports([(name, report(name)[1:], columns[name])
+            for name in order], sheet, args.fuzzy, name_cols, names)
+    else:
+        grade = report(args.score_report)
+        from_col, to_col = select_columns(grade[0], sheet_entries)
+        merged_sheet = merge(grade[1:], from_col, 
+                sheet, to_col, args.fuzzy, name_cols, names)
+
+    directory, filename = os.path.split(args.grading_sheet)
+    final_file = os.path.join(directory, 'final_%s' % filename)
+    tmp_file = final_file + '.tmp'
+    # Written back in the sheet's own format, ready to upload again.
+    writer = SheetWriter(tmp_file, sheet_format(args.grading_sheet))
+    writer.writerow(sheet_entries)
+    writer.writerows(merged_sheet)
+    writer.close()
+    os.rename(tmp_file, final_file)
 
 if __name__ == "__main__":
     main()
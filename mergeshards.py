@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+import sys
+import os
+import re
+import csv
+import glob
+
+REGEX_QUESTION = re.compile(r'^q\d+$')
+
+def score_columns(header):
+    """Slice of the question scores, bop and total of an export row.  The
+    roster columns before them depend on the roster: the 7 of roster.txt or
+    the 3 of a CSV roster."""
+    for x in xrange(len(header)):
+        if REGEX_QUESTION.match(header[x]):
+            return slice(x, None)
+    raise ValueError('no question columns')
+
+def merge_shards(filenames, output):
+    """Stream the CSV exports of several grading shards into `output`.
+
+    A student (id and name) found in more than one shard is reported as a
+    DUPLICATE when the scores agree and as a CONFLICT otherwise; the entry
+    of the first shard is kept either way."""
+    header = None
+    seen = {}
+    conflict_cnt = 0
+    duplicate_cnt = 0
+    row_cnt = 0
+
+    tmp_output = output + '.tmp'
+    out_fd = open(tmp_output, 'wb')
+    writer = csv.writer(out_fd, lineterminator='\n')
+
+    for filename in filenames:
+        fd = open(filename, 'rb')
+        reader = csv.reader(fd)
+        shard_header = next(reader, None)
+
+        if header is None:
+            header = shard_header
+            try:
+                scores_of = score_columns(header or [])
+            except ValueError:
+                fd.close()
+                out_fd.close()
+                os.remove(tmp_output)
+                raise ValueError('%s is not a grading export' % filename)
+            writer.writerow(header)
+        elif shard_header != header:
+            fd.close()
+            out_fd.close()
+            os.remove(tmp_output)
+            raise ValueError('%s has a different rubric: %s' % (
+                filename, ','.join(shard_header or [])))
+
+        for row in reader:
+            key = (row[0], row[2])
+            scores = tuple(row[scores_of])
+
+            if key in seen:
+                first_file, first_scores = seen[key]
+                if first_scores == scores:
+                    print '[DUPLICATE]', row[2], 'in', first_file, \
+                            'and', filename
+                    duplicate_cnt += 1
+                else:
+                    print '[CONFLICT]', row[2], first_file, \
+                            ','.join(first_scores), '<>', filename, \
+                            ','.join(scores)
+                    conflict_cnt += 1
+                continue
+
+            seen[key] = (filename, scores)
+            writer.writerow(row)
+            row_cnt += 1
+
+        fd.close()
+
+    out_fd.close()
+    os.rename(tmp_output, output)
+
+    print 'SHARDS:', len(filenames), 'ROWS:', row_cnt, \
+            'DUPLICATE:', duplicate_cnt, 'CONFLICT:', conflict_cnt
+
+    return conflict_cnt
+
+def main():
+    if len(sys.argv) < 2:
+        print 'Usage: %s subject [shard_csv ...]' % sys.argv[0]
+        sys.exit(1)
+
+    subject = sys.argv[1]
+    filenames = sys.argv[2:] or \
+            sorted(glob.glob('%s-shard*.csv' % subject) +
+                glob.glob('%s-sec*.csv' % subject))
+    if not filenames:
+        print 'No shard exports found for %s.' % subject
+        sys.exit(1)
+
+    try:
+        conflict_cnt = merge_shards(filenames, '%s.csv' % subject)
+    except ValueError as e:
+        print e
+        sys.exit(1)
+
+    sys.exit(1 if conflict_cnt else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,113 @@
 #!/usr/bin/env python
 
+import os
 import sys
+import csv
+import argparse
 
-roster = sys.argv[1]
-scores = sys.argv[2]
+from gradebook import Gradebook
+from roster import RosterFile
 
-records = set([x.split(',')[0] for x in open(scores).readlines()[1:]])
-stu_ids = set([x.split('\t')[0] for x in open(roster).readlines()])
+def load_roster(filename):
+    """Return the `(id, section, name)` of every roster student, in roster
+    order, and an index from student id to position."""
+    students = []
+    index = {}
+    for fields in RosterFile(filename):
+        fields = [x.strip() for x in fields]
+        if len(fields) < 3 or not fields[0]:
+            continue
+        if fields[0] in index:
+            print >> sys.stderr, '[DUPLICATE] roster id %s' % fields[0]
+            continue
+        index[fields[0]] = len(students)
+        students.append(tuple(fields[:3]))
 
-students = open(roster).readlines()
+    return students, index
 
-missing = [students[int(id)-1] for id in stu_ids - records]
+def submitted_ids(filename):
+    """Stream the ids (first column) of a score CSV."""
+    fd = open(filename, 'rb')
+    reader = csv.reader(fd)
+    next(reader, None)
+    for row in reader:
+        if row and row[0].strip():
+            yield row[0].strip()
+    fd.close()
 
-print 'Student who didn\'t turn in homework/exam papers:'
-print '\n'.join(missing)
+def missing_matrix(index, submissions):
+    """Return one row per student with a True for every assignment of
+    `submissions` (pairs of name and submitted ids) it is missing, and the
+    number of unknown ids seen per assignment."""
+    matrix = [[True] * len(submissions) for x in xrange(len(index))]
+    unknown = [0] * len(submissions)
+    for col in xrange(len(submissions)):
+        for sid in submissions[col][1]:
+            row = index.get(sid)
+            if row is None:
+                unknown[col] += 1
+            else:
+                matrix[row][col] = False
+
+    return matrix, unknown
+
+def write_matrix(filename, students, assignments, matrix):
+    tmp_file = filename + '.tmp'
+    fd = open(tmp_file, 'wb')
+    writer = csv.writer(fd, lineterminator='\n')
+    writer.writerow(['id', 'section', 'name'] + assignments + ['missing'])
+    for row in xrange(len(students)):
+        writer.writerow(list(students[row]) +
+                [['', 'X'][flag] for flag in matrix[row]] +
+                [sum(matrix[row])])
+    fd.close()
+    os.rename(tmp_file, filename)
+
+def summarize(students, assignments, matrix, unknown):
+    print 'Student who didn\'t turn in homework/exam papers:'
+    for row in xrange(len(students)):
+        if any(matrix[row]):
+            print '%s\t%s\t%s\t%s' % (students[row] + (' '.join(
+                [assignments[col] for col in xrange(len(assignments))
+                    if matrix[row][col]]),))
+
+    print
+    for col in xrange(len(assignments)):
+        print '%s: %d missing%s' % (assignments[col],
+                sum(matrix[row][col] for row in xrange(len(students))),
+                ['', ', %d unknown ids' % unknown[col]][unknown[col] > 0])
+
+def main():
+    parser = argparse.ArgumentParser(
+            usage='%(prog)s [-o OUTPUT] roster scores [scores ...]\n'
+                '       %(prog)s [-o OUTPUT] --db GRADEBOOK [assignment ...]')
+    parser.add_argument('sources', nargs='*',
+            help='the roster and the score CSVs, or assignments with --db')
+    parser.add_argument('--db', metavar='GRADEBOOK',
+            help='read the roster and the scores from a SQLite gradebook')
+    parser.add_argument('-o', '--output', default='missing.csv',
+            help='students x assignments CSV to write (default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.db:
+        gradebook = Gradebook(args.db)
+        assignments = args.sources or gradebook.assignments()
+        students = list(gradebook.students())
+        index = dict((students[x][0], x) for x in xrange(len(students)))
+        submissions = [(name, gradebook.submitted(name))
+                for name in assignments]
+    else:
+        if len(args.sources) < 2:
+            parser.error('need a roster and at least one score CSV')
+        students, index = load_roster(args.sources[0])
+        assignments = [os.path.splitext(os.path.basename(x))[0]
+                for x in args.sources[1:]]
+        submissions = [(assignments[x], submitted_ids(args.sources[x+1]))
+                for x in xrange(len(assignments))]
+
+    matrix, unknown = missing_matrix(index, submissions)
+    write_matrix(args.output, students, assignments, matrix)
+    summarize(students, assignments, matrix, unknown)
+
+if __name__ == "__main__":
+    main()
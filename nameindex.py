@@ -0,0 +1,173 @@
+import re
+from bisect import bisect_left
+
+REGEX_NAME_SEP = re.compile(r'[\s\-,.]+')
+
+SOUNDEX_CODES = dict((ch, str(code))
+        for code, letters in enumerate(
+            ['AEIOUY', 'BFPV', 'CGJKQSXZ', 'DT', 'L', 'MN', 'R'])
+        for ch in letters)
+
+def tokenize(name):
+    """Split a name into upper-cased tokens on whitespace, hyphens, commas
+    and periods, dropping quotes and empty parts."""
+    return [token for token in
+            REGEX_NAME_SEP.split(name.replace('"', '').upper()) if token]
+
+def soundex(token):
+    """American Soundex code of a name token, e.g. ROBERT -> R163."""
+    letters = [ch for ch in token.upper() if ch.isalpha()]
+    if not letters:
+        return ''
+
+    code = [letters[0]]
+    last = SOUNDEX_CODES.get(letters[0])
+    for ch in letters[1:]:
+        digit = SOUNDEX_CODES.get(ch)
+        if digit is None:
+            # H and W do not separate letters with the same code.
+            continue
+        if digit != last and digit != '0':
+            code.append(digit)
+        last = digit
+
+    return ''.join(code + ['0', '0', '0'])[:4]
+
+def trigrams(tokens):
+    """Character trigrams of the tokens, padded so that the first and the
+    last letters count too."""
+    grams = set()
+    for token in tokens:
+        token = '$%s$' % token
+        for x in xrange(len(token) - 2):
+            grams.add(token[x:x+3])
+    return grams
+
+class Tokens:
+    """Sequence of the tokens of each name, tokenized on first access."""
+
+    def __init__(self, names):
+        self.names = names
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, idx):
+        tokens = self.cache.get(idx)
+        if tokens is None:
+            tokens = self.cache[idx] = tokenize(self.names[idx])
+        return tokens
+
+class NameIndex:
+    """Prefix index over the tokens of a name list.
+
+    Every typed word has to be the prefix of some token of a name for the
+    name to match.  Results are cached along the query being typed, so
+    appending a character narrows the previous match set and deleting one
+    hits the cache."""
+
+    def __init__(self, names, active=None, table=None):
+        if table is None:
+            self.tokens = [tokenize(name) for name in names]
+
+            table = sorted(set((token, idx)
+                for idx in xrange(len(self.tokens))
+                for token in self.tokens[idx]))
+            self.keys = [t[0] for t in table]
+            self.owners = [t[1] for t in table]
+        else:
+            # A prebuilt `(keys, owners)` table; names are only tokenized
+            # when a search has to look at them.
+            self.tokens = Tokens(names)
+            self.keys, self.owners = table
+
+        self.names = None
+        self.results = {}
+        self.reset(range(len(names)) if active is None else active)
+
+    def reset(self, active):
+        self.active = set(active)
+        self.results = {}
+
+    def discard(self, idx):
+        self.active.discard(idx)
+
+    def add(self, idx):
+        self.active.add(idx)
+
+    def prefix_range(self, prefix):
+        lo = bisect_left(self.keys, prefix)
+        # '\xff' sorts after every character that can appear in a token.
+        hi = bisect_left(self.keys, prefix + '\xff', lo)
+        return lo, hi
+
+    def lookup(self, prefix):
+        lo, hi = self.prefix_range(prefix)
+        return set(self.owners[lo:hi])
+
+    def narrow(self, candidates, components):
+        for comp in components:
+            if not comp:
+                continue
+            lo, hi = self.prefix_range(comp)
+            if candidates is None or hi - lo < len(candidates):
+                owners = set(self.owners[lo:hi])
+                candidates = owners if candidates is None \
+                        else candidates & owners
+            else:
+                candidates = set(idx for idx in candidates
+                        if any(t.startswith(comp) for t in self.tokens[idx]))
+
+            if not candidates:
+                break
+
+        return candidates
+
+    def exact(self, name, active=None):
+        """Return the active indices whose tokens are exactly those of
+        `name`.  `active` overrides the indices considered active."""
+        active = self.active if active is None else active
+        if self.names is None:
+            self.names = {}
+            for idx in xrange(len(self.tokens)):
+                self.names.setdefault(tuple(self.tokens[idx]), []).append(idx)
+
+        return [idx for idx in self.names.get(tuple(tokenize(name)), ())
+                if idx in active]
+
+    def search(self, query, active=None):
+        """Return the sorted indices of active names matching `query`.
+        `active` overrides the indices considered active."""
+        active = self.active if active is None else active
+        query = query.upper()
+        components = query.split(' ')
+
+        if query not in self.results:
+            # Keep only the results along the current query so that the
+            # cache stays as short as the query itself.
+            for key in self.results.keys():
+                if not query.startswith(key):
+                    del self.results[key]
+
+            base = None
+            for n in xrange(len(query) - 1, 0, -1):
+                if query[:n] in self.results:
+                    base = query[:n]
+                    break
+
+            if base is None:
+                candidates = self.narrow(None, components)
+            else:
+                # Only the last word of the cached query and the words
+                # typed after it can have changed.
+                start = len(base.split(' ')) - 1
+                candidates = self.narrow(self.results[base],
+                        components[start:])
+
+            if candidates is None:
+                candidates = set(xrange(len(self.tokens)))
+            self.results[query] = candidates
+
+        return sorted(idx for idx in self.results[query]
+                if idx in active)
@@ -0,0 +1,168 @@
+import re
+from array import array
+from math import ceil
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+BP_NONE, BP_POINTS, BP_FACTOR = 0, 1, 2
+
+REGEX_BNP = re.compile(r'^([+|-])(\d+)(\%?)$')
+
+def parse_bonus_penalty(text):
+    """Parse the `+N`, `-N`, `+N%` and `-N%` bonus/penalty syntax into
+    points (int) or a factor (float), or return None."""
+    match = REGEX_BNP.match(text)
+    if not match:
+        return None
+
+    sign, num, pct_flag = match.groups()
+    if pct_flag == '%':
+        return 1 + [-1,1][sign=='+'] * float(num)/100
+    return [-1,1][sign=='+'] * int(num)
+
+def apply_adjustment(score, kind, value):
+    if kind == BP_FACTOR:
+        return score * value
+    if kind == BP_POINTS:
+        return score + value
+    return score
+
+def adjusted_score(score, kind, value, max_score):
+    """Apply a bonus/penalty to a raw total, round it up and clip it to
+    [0, max_score]."""
+    score = ceil(apply_adjustment(score, kind, value))
+    score = max_score if score > max_score else score
+    score = 0 if score < 0 else score
+
+    return score
+
+def adjustment_kind(bp):
+    """Split a bonus/penalty as typed in (int points, float factor, 0) into
+    a kind and a value."""
+    if type(bp) is float:
+        return BP_FACTOR, bp
+    if bp:
+        return BP_POINTS, float(bp)
+    return BP_NONE, 0.0
+
+class RecordStore:
+    """Columnar store of the grades recorded in a session.
+
+    The scores of all records live in one flat array of doubles, `width`
+    per row, next to a column with the roster index of each row.  Bonus and
+    penalty are kept per roster student as a kind column (none, points or
+    factor) and a value column."""
+
+    def __init__(self, width, num_students):
+        self.width = width
+        self.students = array('i')
+        self.scores = array('d')
+        self.rows = {}
+
+        self.bp_kind = array('b', [BP_NONE]) * num_students
+        self.bp_value = array('d', [0.0]) * num_students
+
+    @classmethod
+    def from_lists(cls, width, records, bonus_penalty):
+        """Build a store from the `[student] + grades` records and the
+        bonus/penalty list of older caches."""
+        store = cls(width, len(bonus_penalty))
+        for record in records:
+            store.put(record[0], record[1:])
+        for idx in xrange(len(bonus_penalty)):
+            if bonus_penalty[idx] != 0:
+                store.set_adjustment(idx, bonus_penalty[idx])
+        return store
+
+    def copy(self):
+        store = RecordStore(self.width, 0)
+        store.students = array('i', self.students)
+        store.scores = array('d', self.scores)
+        store.rows = dict(self.rows)
+        store.bp_kind = array('b', self.bp_kind)
+        store.bp_value = array('d', self.bp_value)
+        return store
+
+    def __len__(self):
+        return len(self.students)
+
+    def __contains__(self, student):
+        return student in self.rows
+
+    def __iter__(self):
+        for row in xrange(len(self.students)):
+            yield self.record(row)
+
+    def row_of(self, student):
+        return self.rows.get(student)
+
+    def grades(self, row):
+        return self.scores[row*self.width:(row+1)*self.width].tolist()
+
+    def record(self, row):
+        return [self.students[row]] + self.grades(row)
+
+    def put(self, student, grades):
+        """Record the grades of `student`, replacing earlier ones.  Returns
+        the replaced grades or None."""
+        row = self.rows.get(student)
+        if row is None:
+            self.rows[student] = len(self.students)
+            self.students.append(student)
+            self.scores.extend(grades)
+            return None
+
+        old = self.grades(row)
+        self.scores[row*self.width:(row+1)*self.width] = array('d', grades)
+        return old
+
+    def adjustment(self, student):
+        """Return the bonus/penalty of `student` the way it is typed in: an
+        int for points, a float for a factor, 0 for none."""
+        kind = self.bp_kind[student]
+        if kind == BP_POINTS:
+            return int(self.bp_value[student])
+        if kind == BP_FACTOR:
+            return self.bp_value[student]
+        return 0
+
+    def set_adjustment(self, student, bp):
+        self.bp_kind[student], self.bp_value[student] = adjustment_kind(bp)
+
+    def real_score(self, student, score, max_score):
+        return adjusted_score(score, self.bp_kind[student],
+                self.bp_value[student], max_score)
+
+    def matrix(self):
+        """Return the scores as a rows x width numpy array.  It is a view
+        of the store, so do not keep it across appends."""
+        if not len(self.students):
+            return numpy.zeros((0, self.width))
+        return numpy.frombuffer(self.scores, dtype=float).reshape(
+                len(self.students), self.width)
+
+    def totals(self):
+        """Return the raw total of every row."""
+        if numpy is not None:
+            return self.matrix().sum(axis=1).tolist()
+        return [sum(self.scores[row*self.width:(row+1)*self.width])
+                for row in xrange(len(self.students))]
+
+    def real_totals(self, max_score):
+        """Return the total of every row after bonus/penalty, rounded up
+        and clipped to [0, max_score]."""
+        if numpy is None or not len(self.students):
+            return [self.real_score(self.students[row], total, max_score)
+                    for row, total in enumerate(self.totals())]
+
+        students = numpy.frombuffer(self.students, dtype=numpy.intc)
+        kinds = numpy.frombuffer(self.bp_kind, dtype=numpy.int8)[students]
+        values = numpy.frombuffer(self.bp_value, dtype=float)[students]
+
+        totals = self.matrix().sum(axis=1)
+        totals = numpy.where(kinds == BP_FACTOR, totals * values,
+                numpy.where(kinds == BP_POINTS, totals + values, totals))
+        return numpy.clip(numpy.ceil(totals), 0, max_score).tolist()
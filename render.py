@@ -0,0 +1,38 @@
+from os.path import commonprefix
+
+class Surface:
+    """Remembers the text drawn on each row of a curses window so that
+    redrawing a row only writes the cells that changed."""
+
+    def __init__(self, window, columns):
+        self.window = window
+        self.columns = columns
+        self.rows = {}
+
+    def draw(self, row, text, attr=0):
+        """Show `text` on `row`; return True if anything was written."""
+        text = text[:self.columns]
+        old = self.rows.get(row)
+        if old == (text, attr):
+            return False
+
+        if old is None or old[1] != attr:
+            self.window.move(row, 0)
+            self.window.clrtoeol()
+            if text:
+                self.window.addstr(row, 0, text, attr)
+        else:
+            old_text = old[0]
+            start = len(commonprefix([old_text, text]))
+            if start < len(text):
+                self.window.addstr(row, start, text[start:], attr)
+            if len(text) < len(old_text):
+                self.window.move(row, len(text))
+                self.window.clrtoeol()
+
+        self.rows[row] = (text, attr)
+        return True
+
+    def forget(self, row):
+        """Drop what is known about `row` after it was drawn directly."""
+        self.rows.pop(row, None)
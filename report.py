@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+
+import os
+import re
+import sys
+import csv
+import glob
+import hashlib
+import argparse
+import multiprocessing
+import cPickle as pickle
+
+from stats import ScoreStats, numpy
+
+REGEX_QUESTION = re.compile(r'^q\d+$')
+
+CACHE_FILE = '.report-cache.pickle'
+# Part of every digest, so that summaries cached by an older layout are
+# computed again.
+CACHE_VERSION = 2
+
+def snapshot_files(filename):
+    """Session snapshots that may hold the rubric of an export: its own,
+    then those of the shards mergeshards.py merged it from."""
+    directory, name = os.path.split(filename)
+    subject = os.path.join(directory, '.%s' % os.path.splitext(name)[0])
+    return ['%s.pickle' % subject] + sorted(glob.glob('%s-shard*.pickle' %
+        subject) + glob.glob('%s-sec*.pickle' % subject))
+
+def cached_rubric(filename, rubrics):
+    """Rubric of the session that exported `filename`, read from the
+    session snapshots next to it, or None without one.  `rubrics` maps the
+    snapshots read before to their `(mtime, size)` and rubric, so that
+    only the snapshots changed since are loaded again."""
+    for snapshot in snapshot_files(filename):
+        try:
+            st = os.stat(snapshot)
+        except OSError:
+            continue
+
+        stamp = (st.st_mtime, st.st_size)
+        if snapshot not in rubrics or rubrics[snapshot][0] != stamp:
+            rubrics[snapshot] = (stamp, read_rubric(snapshot))
+        if rubrics[snapshot][1] is not None:
+            return rubrics[snapshot][1]
+    return None
+
+def read_rubric(snapshot):
+    fd = open(snapshot, 'rb')
+    try:
+        return pickle.load(fd)[0]
+    except Exception:
+        return None
+    finally:
+        fd.close()
+
+def file_digest(filename, rubric):
+    digest = hashlib.md5('%d %r' % (CACHE_VERSION, rubric))
+    fd = open(filename, 'rb')
+    for block in iter(lambda: fd.read(1 << 20), ''):
+        digest.update(block)
+    fd.close()
+    return digest.hexdigest()
+
+def read_export(filename):
+    """Return the question titles, the rows of scores (questions then
+    total) and the `(id, name)` of each row of a grading export."""
+    fd = open(filename, 'rb')
+    reader = csv.reader(fd)
+    header = next(reader, [])
+    questions = [x for x in xrange(len(header))
+            if REGEX_QUESTION.match(header[x])]
+    if not questions or 'total' not in header:
+        fd.close()
+        raise ValueError('not a grading export')
+    columns = questions + [header.index('total')]
+
+    scores = []
+    students = []
+    for row in reader:
+        if len(row) < len(header):
+            continue
+        scores.append([float(row[x] or 0) for x in columns])
+        students.append((row[0], row[2]))
+    fd.close()
+
+    return [header[x] for x in questions], scores, students
+
+def summarize_export(task):
+    """Aggregate one export: a `ScoreStats` per question and of the totals,
+    and the total of every student.  Runs in the worker processes."""
+    filename, rubric = task
+    titles, scores, students = read_export(filename)
+
+    if numpy is not None:
+        matrix = numpy.array(scores, dtype=float).reshape(len(scores),
+                len(titles) + 1)
+        columns = [matrix[:, x] for x in xrange(len(titles) + 1)]
+        observed = matrix.max(axis=0).tolist() if len(scores) \
+                else [0] * (len(titles) + 1)
+    else:
+        columns = [[row[x] for row in scores]
+                for x in xrange(len(titles) + 1)]
+        observed = [max(column) if column else 0 for column in columns]
+
+    if rubric is not None and len(rubric) == len(titles):
+        maxes = list(rubric) + [sum(rubric)]
+    else:
+        # Without the rubric the maxima are unknown; the highest scores
+        # only lay out the histograms.
+        rubric = None
+        maxes = observed
+
+    stats = []
+    for x in xrange(len(columns)):
+        column = ScoreStats(maxes[x])
+        column.add_many(columns[x])
+        stats.append(column)
+
+    totals = columns[-1].tolist() if numpy is not None else columns[-1]
+    return {'titles': titles, 'stats': stats, 'rubric': rubric,
+            'students': zip(students, totals)}
+
+def load_cache(filename):
+    """Return the summaries by digest and the rubrics by snapshot saved by
+    the last run."""
+    empty = ({}, {})
+    if not os.path.exists(filename):
+        return empty
+    fd = open(filename, 'rb')
+    try:
+        cache = pickle.load(fd)
+    except Exception:
+        return empty
+    finally:
+        fd.close()
+    return cache if isinstance(cache, tuple) and len(cache) == 2 else empty
+
+def save_cache(filename, cache):
+    tmp_file = filename + '.tmp'
+    fd = open(tmp_file, 'wb')
+    pickle.dump(cache, fd, pickle.HIGHEST_PROTOCOL)
+    fd.close()
+    os.rename(tmp_file, filename)
+
+def summarize_all(filenames, jobs=None, cache_file=CACHE_FILE, rubric=None):
+    """Return `(subject, summary)` pairs for the exports, in order.  Only
+    the files whose content (or rubric) changed since the last run are read
+    again, by a pool of `jobs` processes.  `rubric` stands for the rubric
+    of the exports without a session snapshot."""
+    cache, rubrics = load_cache(cache_file)
+    tasks = [(filename, cached_rubric(filename, rubrics) or rubric)
+            for filename in filenames]
+    digests = [file_digest(filename, rubric) for filename, rubric in tasks]
+
+    todo = [x for x in xrange(len(tasks)) if digests[x] not in cache]
+    if len(todo) > 1 and jobs != 1:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            results = pool.map(attempt, [tasks[x] for x in todo])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [attempt(tasks[x]) for x in todo]
+    for x, result in zip(todo, results):
+        cache[digests[x]] = result
+
+    print '[REPORT] %d exports, %d read, %d unchanged' % (len(tasks),
+            len(todo), len(tasks) - len(todo))
+    snapshots = set(snapshot for filename in filenames
+            for snapshot in snapshot_files(filename))
+    save_cache(cache_file, (dict((digest, cache[digest])
+        for digest in digests), dict((snapshot, rubrics[snapshot])
+            for snapshot in snapshots if snapshot in rubrics)))
+
+    summaries = []
+    for x in xrange(len(tasks)):
+        result = cache[digests[x]]
+        if isinstance(result, basestring):
+            print '[SKIP] %s: %s' % (filenames[x], result)
+            continue
+        if result['rubric'] is None:
+            print '[RUBRIC] %s: no rubric for its %d questions, maxima, ' \
+                    'difficulty and percentages left out (see --rubric)' % (
+                            filenames[x], len(result['titles']))
+        summaries.append((os.path.splitext(os.path.basename(
+            filenames[x]))[0], result))
+    return summaries
+
+def attempt(task):
+    try:
+        return summarize_export(task)
+    except (ValueError, IOError, csv.Error) as e:
+        return str(e)
+
+def write_summary(filename, summaries):
+    tmp_file = filename + '.tmp'
+    fd = open(tmp_file, 'wb')
+    writer = csv.writer(fd, lineterminator='\n')
+    writer.writerow(['subject', 'question', 'n', 'max', 'mean', 'sd', 'min',
+        'high', 'difficulty'])
+    for subject, summary in summaries:
+        known = summary['rubric'] is not None
+        for title, stats in zip(summary['titles'] + ['total'],
+                summary['stats']):
+            writer.writerow([subject, title, stats.n,
+                '%g' % stats.max if known else '',
+                '%.2f' % stats.mean, '%.2f' % stats.sd, '%g' % stats.low,
+                '%g' % stats.high, '%.2f' % (stats.mean / stats.max)
+                if known and stats.max else ''])
+    fd.close()
+    os.rename(tmp_file, filename)
+
+def student_trends(summaries):
+    """Return the students in order of appearance and, per student, the
+    percentage of each subject's maximum scored (None if absent or if the
+    maximum is unknown)."""
+    order = []
+    trends = {}
+    for x in xrange(len(summaries)):
+        known = summaries[x][1]['rubric'] is not None
+        top = summaries[x][1]['stats'][-1].max
+        for student, total in summaries[x][1]['students']:
+            if student not in trends:
+                order.append(student)
+                trends[student] = [None] * len(summaries)
+            if known:
+                trends[student][x] = 100.0 * total / top if top else 0.0
+    return order, trends
+
+def write_students(filename, summaries):
+    order, trends = student_trends(summaries)
+    tmp_file = filename + '.tmp'
+    fd = open(tmp_file, 'wb')
+    writer = csv.writer(fd, lineterminator='\n')
+    writer.writerow(['id', 'name'] + [subject for subject, summary
+        in summaries] + ['mean'])
+    for student in order:
+        percents = [p for p in trends[student] if p is not None]
+        writer.writerow(list(student) + ['' if p is None else '%.1f' % p
+            for p in trends[student]] +
+            ['%.1f' % (sum(percents) / len(percents)) if percents else ''])
+    fd.close()
+    os.rename(tmp_file, filename)
+
+def plot_report(filename, summaries):
+    """Plot the total histogram of every subject, the difficulty of every
+    question and the spread of the students' percentages per subject into
+    `filename`.  Needs numpy and matplotlib."""
+    if numpy is None:
+        raise ImportError('numpy is required for report plots')
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    ncols = min(len(summaries), 4)
+    nrows = (len(summaries) + ncols - 1) // ncols + 2
+    fig = plt.figure(figsize=(4 * ncols, 3 * nrows))
+
+    for x in xrange(len(summaries)):
+        subject, summary = summaries[x]
+        total = summary['stats'][-1]
+        ax = fig.add_subplot(nrows, ncols, x + 1)
+        ax.bar(numpy.arange(len(total.histogram)), total.histogram,
+                color='darkred')
+        ax.set_title('%s /%s: mean %.1f (n=%d)' % (subject, '%g' % total.max
+            if summary['rubric'] is not None else '?', total.mean, total.n),
+            fontsize=9)
+
+    labels = []
+    difficulty = []
+    for subject, summary in summaries:
+        if summary['rubric'] is None:
+            continue
+        for title, stats in zip(summary['titles'], summary['stats']):
+            labels.append('%s %s' % (subject, title))
+            difficulty.append(stats.mean / stats.max if stats.max else 0)
+    ax = fig.add_subplot(nrows, 1, nrows - 1)
+    ax.bar(numpy.arange(len(labels)), difficulty, color='steelblue')
+    ax.set_xticks(numpy.arange(len(labels)))
+    ax.set_xticklabels(labels, rotation=90, fontsize=6)
+    ax.set_title('question difficulty (mean / max)', fontsize=9)
+
+    order, trends = student_trends(summaries)
+    ax = fig.add_subplot(nrows, 1, nrows)
+    ax.boxplot([[trends[student][x] for student in order
+        if trends[student][x] is not None] or [0]
+        for x in xrange(len(summaries))])
+    ax.set_xticklabels([subject for subject, summary in summaries],
+            fontsize=8)
+    ax.set_title('student totals (% of max) per subject', fontsize=9)
+
+    fig.tight_layout()
+    fig.savefig(filename)
+    plt.close(fig)
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Summarize the CSV exports of several grading '
+                'sessions.')
+    parser.add_argument('exports', nargs='*',
+            help='subject CSVs written by grading.py (default: every '
+                'grading export in the current directory)')
+    parser.add_argument('-o', '--output', default='report',
+            help='write OUTPUT.csv (per question), OUTPUT-students.csv '
+                '(per student) and OUTPUT.png (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int,
+            help='worker processes (default: one per CPU)')
+    parser.add_argument('--rubric',
+            help='maximum score of each question, e.g. "5 10 10", for the '
+                'exports without a session snapshot next to them')
+    parser.add_argument('--no-plot', dest='plot', action='store_false',
+            help='only write the CSV summaries')
+    args = parser.parse_args()
+
+    rubric = None
+    if args.rubric:
+        try:
+            rubric = map(int, args.rubric.split())
+        except ValueError:
+            parser.error('invalid rubric %s' % args.rubric)
+
+    outputs = ['%s.csv' % args.output, '%s-students.csv' % args.output]
+    filenames = args.exports or [x for x in sorted(glob.glob('*.csv'))
+            if x not in outputs and not x.startswith('final_')]
+    if not filenames:
+        parser.error('no exports to summarize')
+
+    cache_file = os.path.join(os.path.dirname(args.output), CACHE_FILE)
+    summaries = summarize_all(filenames, args.jobs, cache_file, rubric)
+    if not summaries:
+        print 'No grading exports among the files.'
+        sys.exit(1)
+
+    write_summary(outputs[0], summaries)
+    write_students(outputs[1], summaries)
+    print '[REPORT] %s' % ' '.join(outputs)
+
+    if args.plot:
+        try:
+            plot_report('%s.png' % args.output, summaries)
+        except ImportError as e:
+            print '[PLOT] %s' % e
+            sys.exit(1)
+        print '[PLOT] %s.png' % args.output
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import csv
+import codecs
+
+# Columns of the hand-made, tab separated roster.txt, which has no header.
+LEGACY_HEADER = ['id', 'section', 'name', 'major', 'comajor', 'year', 'credit']
+CSV_HEADER = ['id', 'section', 'name']
+
+# Header titles recognized in course sheets, most specific first.
+ID_COLUMNS = ('student id', 'studentid', 'student number', 'id', 'user id',
+        'username', 'netid')
+SECTION_COLUMNS = ('section', 'course section', 'child course id', 'sec')
+NAME_COLUMNS = ('name', 'full name', 'student name', 'student')
+FIRST_COLUMNS = ('first name', 'firstname', 'first', 'given name')
+LAST_COLUMNS = ('last name', 'lastname', 'last', 'surname', 'family name')
+
+def normalize(title):
+    return title.replace('"', '').strip().lower()
+
+def find_column(titles, candidates):
+    for candidate in candidates:
+        if candidate in titles:
+            return titles.index(candidate)
+    return None
+
+def detect_columns(header):
+    """Locate the id, section and name columns of a sheet header.  Returns
+    a dict of column indices, `name` being None when the name is split in
+    `first` and `last`, or None if no id or name column is found."""
+    titles = [normalize(title) for title in header]
+    columns = dict(id=find_column(titles, ID_COLUMNS),
+            section=find_column(titles, SECTION_COLUMNS),
+            name=find_column(titles, NAME_COLUMNS),
+            first=find_column(titles, FIRST_COLUMNS),
+            last=find_column(titles, LAST_COLUMNS))
+
+    if columns['id'] is None:
+        return None
+    if columns['name'] is None and \
+            (columns['first'] is None or columns['last'] is None):
+        return None
+    return columns
+
+def read_lines(filename):
+    """Yield the lines of a file as UTF-8, decoding the UTF-16 Blackboard
+    uses for its tab delimited downloads and dropping byte order marks."""
+    fd = open(filename, 'rb')
+    bom = fd.read(4)
+    fd.seek(0)
+
+    if bom.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        fd.close()
+        fd = codecs.open(filename, encoding='utf-16')
+        for line in fd:
+            yield line.encode('utf-8')
+    else:
+        first = True
+        for line in fd:
+            if first and line.startswith(codecs.BOM_UTF8):
+                line = line[len(codecs.BOM_UTF8):]
+            first = False
+            yield line
+    fd.close()
+
+def sniff_dialect(line):
+    try:
+        return csv.Sniffer().sniff(line, delimiters=',\t;')
+    except csv.Error:
+        return csv.excel
+
+def read_rows(filename):
+    """Stream the rows of a CSV (or tab delimited) sheet."""
+    lines = read_lines(filename)
+    first = next(lines, None)
+    if first is None:
+        return
+
+    dialect = sniff_dialect(first)
+    for row in csv.reader(prepend(first, lines), dialect):
+        yield row
+
+def sheet_format(filename):
+    """Return the dialect, line terminator and encoding (None for plain
+    UTF-8) of a sheet, to write it back the way `read_rows` found it."""
+    fd = open(filename, 'rb')
+    bom = fd.read(4)
+    fd.close()
+
+    encoding = None
+    if bom.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encoding = 'utf-16'
+    elif bom.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+
+    first = next(read_lines(filename), '')
+    terminator = '\r\n' if first.endswith('\r\n') else '\n'
+    return sniff_dialect(first), terminator, encoding
+
+class SheetWriter:
+    """Writes rows in the format of a sheet, as given by `sheet_format`,
+    so that a Blackboard download goes back as UTF-16 with tabs."""
+
+    def __init__(self, filename, fmt):
+        dialect, terminator, self.encoding = fmt
+        if self.encoding is None:
+            self.fd = open(filename, 'wb')
+        else:
+            self.fd = codecs.open(filename, 'wb', self.encoding)
+        self.writer = csv.writer(self, dialect, lineterminator=terminator)
+
+    def write(self, data):
+        # The csv module writes UTF-8 byte strings.
+        self.fd.write(data if self.encoding is None
+                else data.decode('utf-8'))
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+
+    def writerows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.fd.close()
+
+def prepend(first, rest):
+    yield first
+    for item in rest:
+        yield item
+
+class RosterFile:
+    """Rows of a roster, either the tab separated roster.txt or a course
+    sheet such as a Blackboard download, whose id, section and name
+    columns are found from its header.
+
+    Iterating streams the rows as `[id, section, name, ...]` lists laid out
+    as described by `header`."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.columns = None
+
+        lines = read_lines(filename)
+        first = next(lines, '')
+        if first.strip():
+            header = next(csv.reader([first], sniff_dialect(first)))
+            self.columns = detect_columns(header)
+
+        self.header = LEGACY_HEADER if self.columns is None else CSV_HEADER
+
+    def __iter__(self):
+        if self.columns is None:
+            for line in read_lines(self.filename):
+                if line.strip():
+                    yield line.strip().split('\t')
+            return
+
+        columns = self.columns
+        needed = max(x for x in columns.values() if x is not None)
+        rows = read_rows(self.filename)
+        next(rows, None)
+        for row in rows:
+            if len(row) <= needed or not row[columns['id']].strip():
+                continue
+
+            if columns['name'] is not None:
+                name = row[columns['name']].strip()
+            else:
+                name = '%s %s' % (row[columns['first']].strip(),
+                        row[columns['last']].strip())
+            section = '' if columns['section'] is None \
+                    else row[columns['section']].strip()
+
+            # Rows are kept tab separated in the roster index.
+            yield [field.replace('\t', ' ') for field in
+                    (row[columns['id']].strip(), section, name)]
@@ -0,0 +1,188 @@
+import os
+import mmap
+import struct
+import hashlib
+from array import array
+from itertools import izip
+
+from nameindex import NameIndex
+from roster import RosterFile
+
+MAGIC = 'RIX2'
+# magic, roster size, roster mtime, roster md5, number of sections
+HEADER = struct.Struct('<4sQd16sI')
+SECTION = struct.Struct('<QQ')
+
+(SEC_HEADER, SEC_ROW_OFFSETS, SEC_ROWS, SEC_NAME_OFFSETS, SEC_NAMES,
+        SEC_KEYS, SEC_OWNERS, SEC_IDS, SEC_DUPLICATES) = range(9)
+
+def index_filename(filename):
+    head, tail = os.path.split(filename)
+    return os.path.join(head, '.%s.index' % tail)
+
+def file_digest(filename):
+    digest = hashlib.md5()
+    fd = open(filename, 'rb')
+    for chunk in iter(lambda: fd.read(1 << 16), ''):
+        digest.update(chunk)
+    fd.close()
+    return digest.digest()
+
+def pack_strings(strings):
+    """Return the offsets and the blob of a list of byte strings."""
+    offsets = array('I', [0])
+    for s in strings:
+        offsets.append(offsets[-1] + len(s))
+    return offsets, ''.join(strings)
+
+class StringTable:
+    """Read-only sequence of the strings packed in a mapped blob."""
+
+    def __init__(self, data, offsets, base, convert=None):
+        self.data = data
+        self.offsets = offsets
+        self.base = base
+        self.convert = convert
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, x):
+        if x < 0:
+            x += len(self.offsets) - 1
+        if not 0 <= x < len(self.offsets) - 1:
+            raise IndexError(x)
+
+        s = self.data[self.base+self.offsets[x]:self.base+self.offsets[x+1]]
+        return s if self.convert is None else self.convert(s)
+
+def split_row(line):
+    return line.split('\t')
+
+class RosterIndex:
+    """Compiled form of a roster (see `RosterFile`): its header, rows,
+    names, ids and name search table, kept in `.<roster>.index` next to
+    it.
+
+    The index is memory-mapped and rows and names are only decoded when
+    looked at.  It is rebuilt when the roster changes, which is noticed by
+    its size and mtime or, when only those differ, by its md5."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.index_file = index_filename(filename)
+        self.rebuilt = False
+
+        stat = os.stat(filename)
+        if not self.open(stat):
+            self.build(stat)
+            self.rebuilt = True
+            if not self.open(stat):
+                raise IOError('cannot read back %s' % self.index_file)
+
+    def open(self, stat):
+        try:
+            fd = open(self.index_file, 'rb')
+        except IOError:
+            return False
+
+        try:
+            self.data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except (mmap.error, ValueError):
+            fd.close()
+            return False
+        fd.close()
+
+        if len(self.data) < HEADER.size:
+            return False
+        magic, size, mtime, digest, count = HEADER.unpack_from(self.data)
+        if magic != MAGIC or count != SEC_DUPLICATES + 1:
+            return False
+        if (size, mtime) != (stat.st_size, stat.st_mtime):
+            if size != stat.st_size or digest != file_digest(self.filename):
+                return False
+            # Touched but unchanged; remember the new mtime.
+            fd = open(self.index_file, 'r+b')
+            fd.write(HEADER.pack(MAGIC, size, stat.st_mtime, digest, count))
+            fd.close()
+
+        self.sections = [SECTION.unpack_from(self.data,
+            HEADER.size + x * SECTION.size) for x in xrange(count)]
+
+        self.header = self.section(SEC_HEADER).split('\t')
+        self.rows = StringTable(self.data,
+                self.section_array(SEC_ROW_OFFSETS, 'I'),
+                self.sections[SEC_ROWS][0], split_row)
+        self.names = StringTable(self.data,
+                self.section_array(SEC_NAME_OFFSETS, 'I'),
+                self.sections[SEC_NAMES][0])
+        return True
+
+    def section(self, x):
+        start, length = self.sections[x]
+        return self.data[start:start+length]
+
+    def section_array(self, x, typecode):
+        values = array(typecode)
+        values.fromstring(self.section(x))
+        return values
+
+    def build(self, stat):
+        roster = RosterFile(self.filename)
+        rows = []
+        names = []
+        ids = []
+        seen = set()
+        duplicates = set()
+        for row in roster:
+            rows.append('\t'.join(row))
+            names.append(row[2])
+            sid = row[0].strip()
+            ids.append(sid)
+            if sid in seen:
+                duplicates.add(sid)
+            seen.add(sid)
+
+        name_index = NameIndex(names)
+        row_offsets, row_blob = pack_strings(rows)
+        name_offsets, name_blob = pack_strings(names)
+
+        sections = ['\t'.join(roster.header), row_offsets.tostring(), row_blob,
+                name_offsets.tostring(), name_blob,
+                '\n'.join(name_index.keys),
+                array('i', name_index.owners).tostring(),
+                '\n'.join(ids), '\n'.join(sorted(duplicates))]
+
+        offset = HEADER.size + SECTION.size * len(sections)
+        directory = []
+        for section in sections:
+            directory.append(SECTION.pack(offset, len(section)))
+            offset += len(section)
+
+        tmp_file = self.index_file + '.tmp'
+        fd = open(tmp_file, 'wb')
+        fd.write(HEADER.pack(MAGIC, stat.st_size, stat.st_mtime,
+            file_digest(self.filename), len(sections)))
+        fd.write(''.join(directory))
+        for section in sections:
+            fd.write(section)
+        fd.close()
+        os.rename(tmp_file, self.index_file)
+
+    def id_index(self):
+        """Return the student id -> roster index dict; ids listed twice map
+        to None."""
+        ids = self.section(SEC_IDS).split('\n') if len(self.rows) else []
+        index = dict(izip(ids, xrange(len(ids))))
+        duplicates = self.section(SEC_DUPLICATES)
+        if duplicates:
+            for sid in duplicates.split('\n'):
+                index[sid] = None
+        return index
+
+    def name_index(self, active=None):
+        # Tokens hold no whitespace, so the sorted keys split back at C
+        # speed; bisecting a list beats going through the map.
+        keys = self.section(SEC_KEYS).split('\n') if len(self.rows) else []
+        return NameIndex(self.names, active,
+                table=(keys, self.section_array(SEC_OWNERS, 'i')))
@@ -0,0 +1,88 @@
+DEFAULT_STEP = 0.5
+
+START = 0
+# Kind of each automaton state: a prefix of some score only, a whole score
+# that could still grow into another one, or a whole score that cannot.
+PARTIAL, COMPLETE, ACCEPT = 0, 1, 2
+
+def decimals(step):
+    """Number of decimals needed to write multiples of `step`."""
+    digits = 0
+    while abs(step * 10 ** digits - round(step * 10 ** digits)) > 1e-9:
+        digits += 1
+    return digits
+
+class ScoreAutomaton:
+    """Valid-prefix automaton of the scores of one question, from 0 to
+    `max` in multiples of `step`.
+
+    Integers are typed as such.  With the default step of 0.5, `.x` stands
+    for x + 0.5; other fractional steps are typed as decimals (`3.25`).
+    The transitions are kept as one dict per state, so that every key
+    costs one lookup."""
+
+    def __init__(self, max, step=DEFAULT_STEP):
+        self.max = max
+        self.step = step
+        self.transitions = [{}]
+        self.values = [None]
+
+        for text, value in self.spellings():
+            state = START
+            for ch in text:
+                following = self.transitions[state].get(ch)
+                if following is None:
+                    following = len(self.transitions)
+                    self.transitions[state][ch] = following
+                    self.transitions.append({})
+                    self.values.append(None)
+                state = following
+            self.values[state] = value
+
+        self.kinds = [PARTIAL if self.values[x] is None else
+                [ACCEPT, COMPLETE][bool(self.transitions[x])]
+                for x in xrange(len(self.transitions))]
+
+    def spellings(self):
+        for n in xrange(int(self.max) + 1):
+            yield str(n), float(n)
+
+        if self.step == 0.5:
+            for n in xrange(int(self.max)):
+                yield '.%d' % n, n + 0.5
+        elif self.step < 1:
+            digits = decimals(self.step)
+            for k in xrange(1, int(round(self.max / self.step)) + 1):
+                value = round(k * self.step, digits)
+                if value != int(value) and value <= self.max:
+                    yield ('%.*f' % (digits, value)).rstrip('0'), value
+
+    def next(self, state, ch):
+        """Return the state reached by typing `ch`, or None if no score
+        starts that way."""
+        return self.transitions[state].get(ch)
+
+    def parse(self, text):
+        """Value of `text`, spelled as in GRADE mode (`.7` is 7.5 with the
+        default step) or as a plain decimal (`7.5`), or None if it is not a
+        score of the question."""
+        state = START
+        for ch in text:
+            state = self.next(state, ch)
+            if state is None:
+                break
+        else:
+            if self.values[state] is not None:
+                return self.values[state]
+
+        try:
+            score = float(text)
+        except ValueError:
+            return None
+        return score if self.allows(score) else None
+
+    def allows(self, score):
+        if score < 0 or score > self.max:
+            return False
+        steps = score / self.step
+        return abs(steps - round(steps)) < 1e-9
@@ -0,0 +1,237 @@
+import os
+import json
+import errno
+import socket
+import select
+
+RECV_SIZE = 65536
+LISTEN_BACKLOG = 16
+
+def socket_name(name):
+    return '.%s.sock' % name
+
+class Connection:
+    """JSON messages over a stream socket, one per line."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.received = ''
+        self.unsent = ''
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def receive(self):
+        """Read what the socket has ready and return the whole messages in
+        it, or None once the peer has hung up."""
+        data = self.sock.recv(RECV_SIZE)
+        if not data:
+            return None
+
+        self.received += data
+        lines = self.received.split('\n')
+        self.received = lines.pop()
+        return [json.loads(line) for line in lines if line]
+
+    def send(self, message):
+        self.sock.sendall(json.dumps(message) + '\n')
+
+    def queue(self, message):
+        self.unsent += json.dumps(message) + '\n'
+
+    def send_queued(self):
+        if self.unsent:
+            sent = self.sock.send(self.unsent)
+            self.unsent = self.unsent[sent:]
+
+    def close(self):
+        self.sock.close()
+
+class GradeServer:
+    """Serves one grading session to the clients of a UNIX socket.
+
+    The server alone owns the session state, its journal, export and
+    gradebook; clients keep a replica, sent whole when they connect and kept
+    up to date with the changes made by the others.  A student selected by
+    a client is claimed for it and leaves the name lists of the other
+    clients until it is graded or released.
+
+    Everything received in one pass of the select loop is applied first,
+    then saved by a single `persist` (a group commit) before the changes
+    are pushed to the clients, the one that made them included."""
+
+    def __init__(self, grading, path):
+        self.grading = grading
+        # Changes are queued until the group commit.
+        grading.journal.deferred = True
+        self.path = path
+        self.listener = None
+        self.clients = []
+        # Connection -> student claimed by it.
+        self.claims = {}
+        # (origin, message) to push once saved.
+        self.pushes = []
+        self.changes = 0
+
+    def listen(self):
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except socket.error:
+                # Left behind by a server that did not shut down.
+                os.unlink(self.path)
+            else:
+                probe.close()
+                raise ValueError('%s is already being served' % self.path)
+
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen(LISTEN_BACKLOG)
+
+    def serve_forever(self):
+        while True:
+            writing = [conn for conn in self.clients if conn.unsent]
+            readable, writable, _ = select.select(
+                    [self.listener] + self.clients, writing, [])
+
+            for conn in writable:
+                self.send_queued(conn)
+            for conn in readable:
+                if conn is self.listener:
+                    self.accept()
+                elif conn in self.clients:
+                    self.receive(conn)
+
+            if self.changes:
+                self.grading.persist()
+                self.changes = 0
+            for origin, message in self.pushes:
+                for conn in self.clients:
+                    if conn is not origin:
+                        conn.queue(message)
+            self.pushes = []
+            for conn in list(self.clients):
+                self.send_queued(conn)
+
+    def close(self):
+        for conn in self.clients:
+            conn.close()
+        if self.listener is not None:
+            self.listener.close()
+            os.unlink(self.path)
+        self.grading.persist()
+        self.grading.save()
+
+    def accept(self):
+        sock, _ = self.listener.accept()
+        sock.setblocking(0)
+        conn = Connection(sock)
+        self.clients.append(conn)
+        conn.queue(self.state())
+        print '[CONNECT] %d grader(s)' % len(self.clients)
+
+    def drop(self, conn):
+        self.clients.remove(conn)
+        self.release(conn)
+        conn.close()
+        print '[DISCONNECT] %d grader(s)' % len(self.clients)
+
+    def send_queued(self, conn):
+        try:
+            conn.send_queued()
+        except socket.error as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                self.drop(conn)
+
+    def receive(self, conn):
+        try:
+            messages = conn.receive()
+        except (socket.error, ValueError):
+            messages = None
+        if messages is None:
+            self.drop(conn)
+            return
+
+        for message in messages:
+            try:
+                self.handle(conn, message)
+            except (KeyError, TypeError, ValueError) as e:
+                conn.queue({'op': 'error', 'message': str(e)})
+
+    def state(self):
+        grading = self.grading
+        records = grading.records
+        return {'op': 'state', 'subject': grading.subject,
+                'roster': os.path.abspath(grading.roster_file),
+                'shard': None if grading.shard is None else
+                    [grading.shard.option, grading.shard.spec],
+                'students': len(grading.namelist),
+                'assigned': grading.num_students,
+                'rubric': grading.rubric, 'step': grading.step,
+                'curve': grading.curve.specs(),
+                'remain': sorted(grading.remain_indices),
+                'records': list(records),
+                'adjustments': [(idx, records.adjustment(idx))
+                    for idx in xrange(len(grading.namelist))
+                    if records.adjustment(idx)],
+                'claimed': self.claims.values()}
+
+    def handle(self, conn, message):
+        op = message['op']
+        if op == 'claim':
+            self.claim(conn, message['idx'])
+        elif op == 'release':
+            self.release(conn)
+        elif op == 'grade':
+            idx, grades = self.claimed(conn, message['idx']), \
+                    map(float, message['grades'])
+            if len(grades) != self.grading.num_questions or not all(
+                    self.grading.automata[x].allows(grades[x])
+                    for x in xrange(len(grades))):
+                raise ValueError('invalid grades %s' % grades)
+
+            self.grading.commit_grade(idx, grades, flush=False)
+            self.changes += 1
+            # A graded student leaves the name lists for good.
+            del self.claims[conn]
+            # Pushed to its grader too, as the acknowledgement.
+            self.pushes.append((None, {'op': 'graded', 'idx': idx,
+                'grades': grades}))
+        elif op == 'adjust':
+            idx, bp = self.claimed(conn, message['idx']), message['bp']
+            if type(bp) not in (int, float):
+                raise ValueError('invalid bonus/penalty %s' % bp)
+
+            self.grading.set_adjustment(idx, bp, flush=False)
+            self.changes += 1
+            self.pushes.append((None, {'op': 'adjusted', 'idx': idx,
+                'bp': bp}))
+        else:
+            raise ValueError('unknown request %s' % op)
+
+    def claimed(self, conn, idx):
+        if self.claims.get(conn) != idx:
+            raise ValueError('%s is not claimed' % idx)
+        return idx
+
+    def claim(self, conn, idx):
+        grading = self.grading
+        reply = {'op': 'claim', 'idx': idx, 'ok': False}
+        if idx not in grading.remain_indices and idx not in grading.records:
+            reply['message'] = 'student %s is not graded here' % idx
+        elif idx in self.claims.values() and self.claims.get(conn) != idx:
+            reply['message'] = '%s is being graded by another grader' % \
+                    grading.namelist[idx]
+        else:
+            reply['ok'] = True
+            if self.claims.get(conn) != idx:
+                self.release(conn)
+                self.claims[conn] = idx
+                self.pushes.append((conn, {'op': 'claimed', 'idx': idx}))
+        conn.queue(reply)
+
+    def release(self, conn):
+        idx = self.claims.pop(conn, None)
+        if idx is not None:
+            self.pushes.append((conn, {'op': 'released', 'idx': idx}))
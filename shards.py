@@ -0,0 +1,47 @@
+import re
+
+REGEX_SHARD = re.compile(r'^(\d+)/(\d+)$')
+
+class IndexShard:
+    """The k-th of n contiguous index ranges of the roster."""
+
+    option = 'shard'
+
+    def __init__(self, spec):
+        match = REGEX_SHARD.match(spec)
+        if not match:
+            raise ValueError('shard must look like K/N, got %s' % spec)
+
+        self.spec = spec
+        self.k, self.n = map(int, match.groups())
+        if not 1 <= self.k <= self.n:
+            raise ValueError('shard %s is out of range' % spec)
+
+        self.tag = 'shard%dof%d' % (self.k, self.n)
+
+    def select(self, roster):
+        lo = len(roster) * (self.k - 1) // self.n
+        hi = len(roster) * self.k // self.n
+        return range(lo, hi)
+
+class SectionShard:
+    """The students of one or more sections (second roster column)."""
+
+    option = 'section'
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.sections = [x.strip() for x in spec.split(',') if x.strip()]
+        if not self.sections:
+            raise ValueError('no section given')
+
+        self.tag = 'sec' + '+'.join(self.sections)
+
+    def select(self, roster):
+        sections = set(self.sections)
+        return [idx for idx in xrange(len(roster))
+                if len(roster[idx]) > 1 and roster[idx][1].strip() in sections]
+
+def make_shard(option, spec):
+    """The shard given as `--shard` or `--section` `spec`."""
+    return {'shard': IndexShard, 'section': SectionShard}[option](spec)
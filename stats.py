@@ -0,0 +1,198 @@
+from math import sqrt
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+HIST_BUCKETS = 10
+SPARK_LEVELS = ' .:-=+*#'
+
+class ScoreStats:
+    """Running count, mean, variance, min/max and histogram of the scores
+    of one question, updated in O(1) per score (Welford)."""
+
+    def __init__(self, max, buckets=HIST_BUCKETS):
+        self.max = max
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.histogram = [0] * buckets
+        # Occurrences of each distinct score, so that min/max survive
+        # removals without looking at the records again.
+        self.counts = {}
+
+    def bucket(self, score):
+        if self.max <= 0:
+            return 0
+        return max(0, min(int(score * len(self.histogram) / self.max),
+            len(self.histogram) - 1))
+
+    def add(self, score):
+        self.n += 1
+        delta = score - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (score - self.mean)
+
+        self.histogram[self.bucket(score)] += 1
+        self.counts[score] = self.counts.get(score, 0) + 1
+
+    def add_many(self, scores):
+        """Fold a whole column of scores in at once, merging its moments
+        with the running ones (Chan et al.)."""
+        if numpy is None:
+            for score in scores:
+                self.add(score)
+            return
+
+        scores = numpy.asarray(scores, dtype=float)
+        if not len(scores):
+            return
+
+        n = self.n + len(scores)
+        mean = scores.mean()
+        delta = mean - self.mean
+        self.m2 += ((scores - mean) ** 2).sum() + \
+                delta * delta * self.n * len(scores) / n
+        self.mean += delta * len(scores) / n
+        self.n = n
+
+        if self.max > 0:
+            buckets = numpy.clip((scores * len(self.histogram) / self.max
+                ).astype(int), 0, len(self.histogram) - 1)
+        else:
+            buckets = numpy.zeros(len(scores), dtype=int)
+        counts = numpy.bincount(buckets, minlength=len(self.histogram))
+        for x in xrange(len(self.histogram)):
+            self.histogram[x] += int(counts[x])
+
+        values, counts = numpy.unique(scores, return_counts=True)
+        for value, count in zip(values.tolist(), counts.tolist()):
+            self.counts[value] = self.counts.get(value, 0) + count
+
+    def remove(self, score):
+        if self.n <= 1:
+            self.__init__(self.max, len(self.histogram))
+            return
+
+        delta = score - self.mean
+        self.mean = (self.n * self.mean - score) / (self.n - 1)
+        self.m2 = max(0.0, self.m2 - delta * (score - self.mean))
+        self.n -= 1
+
+        self.histogram[self.bucket(score)] -= 1
+        self.counts[score] -= 1
+        if not self.counts[score]:
+            del self.counts[score]
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    @property
+    def sd(self):
+        return sqrt(self.variance)
+
+    @property
+    def low(self):
+        return min(self.counts) if self.counts else 0
+
+    @property
+    def high(self):
+        return max(self.counts) if self.counts else 0
+
+    def sparkline(self, width):
+        """Render the histogram in `width` characters."""
+        width = max(1, min(width, len(self.histogram)))
+        cells = [0] * width
+        for x in xrange(len(self.histogram)):
+            cells[x * width // len(self.histogram)] += self.histogram[x]
+
+        peak = max(cells)
+        if not peak:
+            return ' ' * width
+        return ''.join(SPARK_LEVELS[
+            (c * (len(SPARK_LEVELS) - 1) + peak - 1) // peak] for c in cells)
+
+class SessionStats:
+    """Per-question and total statistics of a grading session."""
+
+    def __init__(self, rubric, store=None):
+        self.questions = [ScoreStats(max) for max in rubric]
+        self.total = ScoreStats(sum(rubric))
+
+        if store is None or not len(store):
+            return
+        if numpy is None:
+            for record in store:
+                self.add(record[1:])
+            return
+
+        matrix = store.matrix()
+        for x in xrange(len(self.questions)):
+            self.questions[x].add_many(matrix[:, x])
+        self.total.add_many(matrix.sum(axis=1))
+
+    @property
+    def n(self):
+        return self.total.n
+
+    def columns(self):
+        return self.questions + [self.total]
+
+    def add(self, grades):
+        for x in xrange(len(self.questions)):
+            self.questions[x].add(grades[x])
+        self.total.add(sum(grades))
+
+    def remove(self, grades):
+        for x in xrange(len(self.questions)):
+            self.questions[x].remove(grades[x])
+        self.total.remove(sum(grades))
+
+def plot_summary(rubric, store, filename):
+    """Plot a histogram per question and of the totals of the records in
+    `store` into `filename`.  Needs numpy and matplotlib."""
+    if numpy is None:
+        raise ImportError('numpy is required for summary plots')
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    matrix = store.matrix()
+    n = len(matrix)
+    maxes = numpy.array(rubric, dtype=float)
+    totals = matrix.sum(axis=1)
+
+    means = matrix.mean(axis=0) if n else numpy.zeros(len(rubric))
+    sds = matrix.std(axis=0, ddof=1) if n > 1 \
+            else numpy.zeros(len(rubric))
+    difficulty = means / numpy.where(maxes > 0, maxes, 1)
+
+    columns = len(rubric) + 1
+    ncols = min(columns, 4)
+    nrows = (columns + ncols - 1) // ncols
+    fig, axes = plt.subplots(nrows, ncols, squeeze=False,
+            figsize=(4 * ncols, 3 * nrows))
+    axes = axes.ravel()
+
+    for x in xrange(len(rubric)):
+        axes[x].hist(matrix[:, x], bins=numpy.arange(0, maxes[x] + 1.5) - 0.25,
+                color='steelblue')
+        axes[x].set_title('q%d /%d: mean %.2f sd %.2f (%.0f%%)' % (
+            x + 1, rubric[x], means[x], sds[x], difficulty[x] * 100),
+            fontsize=9)
+
+    axes[len(rubric)].hist(totals, bins=min(20, max(1, sum(rubric))),
+            range=(0, sum(rubric)), color='darkred')
+    axes[len(rubric)].set_title('total /%d: mean %.2f (n=%d)' % (
+        sum(rubric), totals.mean() if n else 0, n),
+        fontsize=9)
+
+    for ax in axes[columns:]:
+        ax.axis('off')
+
+    fig.tight_layout()
+    fig.savefig(filename)
+    plt.close(fig)